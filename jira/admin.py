@@ -1,15 +1,120 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
 from .models import Company, Employee, Project, Module, MyUser
 from django.contrib.auth.admin import UserAdmin
 
-admin.site.register(Company)
-admin.site.register(Employee)
-admin.site.register(Project)
-admin.site.register(Module)
 
+def estimated_row_count(model, using='default'):
+    """
+    :return: row count of the model's table from the database statistics, None when the database keeps none
+    """
+    connection = connections[using]
+    table = model._meta.db_table
 
-class MyUserAdmin(UserAdmin):  # to show extra details in admin panel instead of just object name
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute('SELECT table_rows FROM information_schema.tables '
+                           'WHERE table_schema = DATABASE() AND table_name = %s', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for big changelists: an unfiltered list takes its count from the table statistics
+    instead of a COUNT(*) over every row. Filtered lists and small tables are counted exactly.
+    """
+    estimate_above = 10000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+
+        if query is not None and not query.where:
+            estimate = estimated_row_count(self.object_list.model, self.object_list.db)
+            if estimate is not None and estimate > self.estimate_above:
+                return estimate
+
+        return super(EstimatedCountPaginator, self).count
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """
+    Defaults for the jira changelists: no second COUNT(*) for the "x total" link, estimated counts and
+    index lookups for search
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Matches the search term as a prefix, case included, against each of search_fields, which must all be
+        indexed columns. A prefix LIKE is served by the index, on PostgreSQL by the varchar_pattern_ops index Django
+        adds to indexed text columns, while Django's own lookups compare UPPER() of the column, which none serves.
+        The autocomplete widgets search the same way.
+        """
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+
+        query = Q()
+        for field in self.get_search_fields(request):
+            query |= Q(**{'{}__startswith'.format(field): search_term})
+        return queryset.filter(query), False
+
+
+@admin.register(Company)
+class CompanyAdmin(ScalableAdmin):
+    list_display = ('company_name', 'year')
+    search_fields = ('company_name',)
+    list_filter = ('year',)
+    ordering = ('company_name',)  # unique, so ordered by its index
+
+
+@admin.register(Employee)
+class EmployeeAdmin(ScalableAdmin):
+    list_display = ('employee', 'age', 'gender', 'salary', 'date_of_joining')
+    list_select_related = ('employee',)  # Employee.__str__ reads the user
+    search_fields = ('employee__email', 'employee__full_name')
+    list_filter = ('gender', 'employee__designation', 'date_of_joining')
+    autocomplete_fields = ('employee',)
+    ordering = ('id',)
+
+
+@admin.register(Project)
+class ProjectAdmin(ScalableAdmin):
+    list_display = ('project_name', 'project_code', 'company', 'team_leader')
+    list_select_related = ('company', 'team_leader')
+    search_fields = ('project_code', 'project_name')
+    list_filter = ('company',)
+    autocomplete_fields = ('company', 'team_leader', 'team_members')
+    ordering = ('id',)
+
+
+@admin.register(Module)
+class ModuleAdmin(ScalableAdmin):
+    list_display = ('module_name', 'module_code', 'project', 'employee', 'assignee', 'start_date', 'end_date')
+    list_select_related = ('project__company', 'employee', 'assignee')  # Project.__str__ reads the company
+    search_fields = ('module_code', 'module_name')
+    list_filter = ('end_date',)
+    autocomplete_fields = ('project', 'employee', 'assignee')
+    ordering = ('id',)
+
+
+class MyUserAdmin(ScalableAdmin, UserAdmin):  # to show extra details in admin panel instead of just object name
     list_display = ('email', 'full_name', 'designation', 'username', 'is_staff')
+    search_fields = ('email', 'full_name')  # also used by the autocomplete widgets
+    list_filter = ('designation', 'is_staff', 'is_superuser', 'is_active')
+    ordering = ('email',)  # UserAdmin orders by username, which has no index
 
 
 admin.site.register(MyUser, MyUserAdmin)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class JiraConfig(AppConfig):
     name = 'jira'
+
+    def ready(self):
+        from . import reports, changes  # noqa: F401 connects the cost summary and change feed signal handlers
@@ -0,0 +1,128 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Module, ArchivedModule
+from .snapshot import signals_disabled
+from .tenancy import taken_values
+
+# ARCHIVE_MODULES_AFTER_DAYS = 365 in settings.py, modules whose end_date is older are archived
+ARCHIVE_AFTER_DAYS = 365
+ARCHIVE_CHUNK_SIZE = 500
+
+MODULE_FIELDS = ('module_name', 'module_code', 'project_id', 'employee_id', 'start_date', 'end_date', 'assignee_id')
+
+
+def archive_cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'ARCHIVE_MODULES_AFTER_DAYS', ARCHIVE_AFTER_DAYS)
+    return timezone.now() - timedelta(days=days)
+
+
+def archive_modules(days=None, chunk_size=ARCHIVE_CHUNK_SIZE, using=None):
+    """
+    Moves the modules that ended more than `days` ago into ArchivedModule, one transaction per chunk,
+    so a long run never holds locks on the whole Module table. Archiving is not a change of the assignments or
+    the costs, so the deletes run without model signals: no feed entries and no cost refresh. Signals are off for
+    the whole process, run it from a command such as archive_modules.
+    :param using: database of the modules, default is the one the router gives
+    :return: number of modules archived
+    """
+    using = using or router.db_for_write(Module)
+    cutoff = archive_cutoff(days)
+    archived = 0
+
+    while True:
+        with transaction.atomic(using=using):
+            rows = list(Module.objects.using(using).filter(end_date__lt=cutoff).order_by('id')
+                        .values_list('id', *MODULE_FIELDS)[:chunk_size])
+            if not rows:
+                break
+
+            ArchivedModule.objects.using(using).bulk_create([
+                ArchivedModule(original_id=row[0], **dict(zip(MODULE_FIELDS, row[1:]))) for row in rows
+            ])
+            with signals_disabled():
+                Module.objects.using(using).filter(id__in=[row[0] for row in rows]).delete()
+
+        archived += len(rows)
+
+    return archived
+
+
+def restore_modules(archived_ids, using=None):
+    """
+    Moves archived modules back into Module. A module is skipped when its employee account is gone,
+    or when the employee or the module code is taken by a live module of any database (Module.employee is
+    one-to-one).
+    Archived codes are not unique, a code that was reused is only restored once.
+    :return: (number restored, list of (module_code, reason) for each skipped module)
+    """
+    using = using or router.db_for_write(Module)
+    skipped = []
+
+    with transaction.atomic(using=using):
+        archived = list(ArchivedModule.objects.using(using).filter(id__in=archived_ids).select_for_update())
+
+        employee_ids = [module.employee_id for module in archived if module.employee_id is not None]
+        codes = [module.module_code for module in archived]
+        busy_employees = taken_values(Module, 'employee', employee_ids)
+        busy_codes = taken_values(Module, 'module_code', codes)
+        busy_ids = set(Module.objects.using(using).filter(id__in=[module.original_id for module in archived])
+                       .values_list('id', flat=True))
+
+        restored = []
+        for module in archived:
+            if module.employee_id is None or module.assignee_id is None:
+                skipped.append((module.module_code, 'employee or assignee account was deleted'))
+            elif module.original_id in busy_ids:
+                skipped.append((module.module_code, 'module id is used by a live module'))
+            elif module.employee_id in busy_employees:
+                skipped.append((module.module_code, 'employee already works on a live module'))
+            elif module.module_code in busy_codes:
+                skipped.append((module.module_code, 'module code is used by a live module'))
+            else:
+                busy_employees.add(module.employee_id)
+                busy_codes.add(module.module_code)
+                busy_ids.add(module.original_id)
+                restored.append(module)
+
+        Module.objects.using(using).bulk_create([
+            Module(id=module.original_id, **{field: getattr(module, field) for field in MODULE_FIELDS})
+            for module in restored
+        ])
+        ArchivedModule.objects.using(using).filter(id__in=[module.id for module in restored]).delete()
+        # bulk_create sends no signals: project cost summaries count archived modules too, so moving them back
+        # changes no cost, and like archiving, a restore writes no feed entries
+
+    return len(restored), skipped
+
+
+def reserve_archived_ids(using):
+    """
+    Moves the Module id sequence past the original ids of the archived modules, so new modules never take
+    an id a restore needs. Run it after sequence_reset_sql, which only looks at the live modules.
+    """
+    connection = connections[using]
+    table = Module._meta.db_table
+    last_id = max(Module.objects.using(using).aggregate(last=Max('id'))['last'] or 0,
+                  ArchivedModule.objects.using(using).aggregate(last=Max('original_id'))['last'] or 0)
+    if not last_id:
+        return
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)", [table, last_id])
+        elif connection.vendor == 'mysql':
+            cursor.execute('ALTER TABLE {} AUTO_INCREMENT = {:d}'.format(connection.ops.quote_name(table),
+                                                                          last_id + 1))
+        elif connection.vendor == 'sqlite':
+            # AUTOINCREMENT tables keep their counter in sqlite_sequence, the row is missing until the first insert
+            cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s',
+                           [last_id, table, last_id])
+            cursor.execute('INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s '
+                           'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+                           [table, last_id, table])
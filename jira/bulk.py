@@ -0,0 +1,117 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .changes import record_many_changes
+from .models import Project, Module, MyUser
+from .reports import refresh_project_costs
+from .tenancy import taken_values
+
+# rows per CASE statement of the employee update, two query parameters each
+BULK_CHUNK_SIZE = 200
+
+
+def bulk_change_modules(modules, project=None, assignee=None, employees=None, shift=None, extend=None):
+    """
+    Moves many modules to another project, hands them to another team leader, gives them new employees
+    and shifts their dates in one transaction. The modules are validated together and changed with one
+    UPDATE per kind of change instead of a form save per module.
+    :param modules: queryset of the modules the user may change, it decides the database too
+    :param project: new project of every module
+    :param assignee: new team leader (assignee) of every module
+    :param employees: dict of module id -> new employee id, None for an unknown employee
+    :param shift: timedelta added to the start and end dates
+    :param extend: timedelta added to the end date only
+    :return: dict of module id -> (module code, None when changed or the reason it was skipped)
+    """
+    employees = employees or {}
+    using = modules.db
+    results = {}
+
+    with transaction.atomic(using=using):
+        rows = list(modules.select_for_update().order_by('id')
+                    .values('id', 'module_name', 'module_code', 'project_id', 'employee_id', 'assignee_id',
+                            'start_date', 'end_date'))
+        by_id = {row['id']: row for row in rows}
+
+        # new employees must be Employees without a module in any database, Module.employee is one-to-one
+        targets = [employee_id for module_id, employee_id in employees.items()
+                   if module_id in by_id and employee_id != by_id[module_id]['employee_id']]
+        valid_employees = set(MyUser.objects.filter(id__in=targets, designation='Employee')
+                              .values_list('id', flat=True))
+        busy_employees = taken_values(Module, 'employee', targets)
+        claimed = set()
+
+        changed = []
+        for row in rows:
+            reason = None
+            employee_id = employees.get(row['id'], row['employee_id'])
+
+            if row['id'] in employees and employee_id is None:
+                reason = 'unknown employee'
+            elif employee_id != row['employee_id']:
+                if employee_id not in valid_employees:
+                    reason = 'new employee is not an Employee'
+                elif employee_id in busy_employees or employee_id in claimed:
+                    reason = 'new employee already works on a module'
+                else:
+                    claimed.add(employee_id)
+
+            if reason is None and extend is not None and row['end_date'] + extend <= row['start_date']:
+                reason = 'end date would not be later than the start date'
+
+            results[row['id']] = (row['module_code'], reason)
+            if reason is None:
+                changed.append(row)
+
+        if changed:
+            _apply(using, changed, project, assignee, employees, shift, extend)
+            _after_bulk_change(using, changed, project, assignee, employees)
+
+    return results
+
+
+def _apply(using, changed, project, assignee, employees, shift, extend):
+    queryset = Module.objects.using(using).filter(id__in=[row['id'] for row in changed])
+
+    values = {}
+    if project is not None:
+        values['project'] = project
+    if assignee is not None:
+        values['assignee'] = assignee
+    if shift is not None:
+        values['start_date'] = F('start_date') + shift
+    if shift is not None or extend is not None:
+        values['end_date'] = F('end_date') + (shift or timedelta(0)) + (extend or timedelta(0))
+    if values:
+        queryset.update(**values)
+
+    reassigned = [row['id'] for row in changed
+                  if row['id'] in employees and employees[row['id']] != row['employee_id']]
+    for start in range(0, len(reassigned), BULK_CHUNK_SIZE):
+        chunk = reassigned[start:start + BULK_CHUNK_SIZE]
+        Module.objects.using(using).filter(id__in=chunk).update(employee_id=Case(
+            *[When(id=module_id, then=Value(employees[module_id])) for module_id in chunk],
+            output_field=IntegerField()))
+
+
+def _after_bulk_change(using, changed, project, assignee, employees):
+    """
+    The model signals do not run for QuerySet.update(), so the cost summaries and the change feed
+    are updated here, once for the whole batch
+    """
+    project_ids = {row['project_id'] for row in changed}
+    if project is not None:
+        project_ids.add(project.pk)
+    refresh_project_costs(project_ids, using=using)
+
+    leaders = dict(Project.objects.using(using).filter(id__in=project_ids).values_list('id', 'team_leader_id'))
+    changes = []
+    for row in changed:
+        recipients = {row['employee_id'], row['assignee_id'], leaders.get(row['project_id']),
+                      employees.get(row['id']), assignee.pk if assignee else None,
+                      leaders.get(project.pk) if project else None}
+        changes.append(('module', 'updated', row['id'], '{} ({})'.format(row['module_name'], row['module_code']),
+                        recipients))
+    record_many_changes(changes, using=using)
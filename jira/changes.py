@@ -0,0 +1,164 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.utils import timezone
+
+from .models import MyUser, Project, Module, AssignmentChange
+
+# CHANGE_FEED_CLIENT_INTERVAL = 30   seconds between two polls of an open list, doubled after each poll
+#                                    that found nothing
+# CHANGE_FEED_CLIENT_MAX_INTERVAL = 300  longest wait between two polls of an idle list
+# CHANGE_FEED_POLL_INTERVAL = 2      seconds between two feed queries of a long-poll or an event stream
+# CHANGE_FEED_STREAMING = False      allows event streams and long-polls, each holds a worker for up to
+#                                    CHANGE_FEED_MAX_WAIT, so only turn it on with async or threaded workers
+# CHANGE_FEED_MAX_WAIT = 25          seconds a long-poll request waits, and an event stream stays open
+# CHANGE_FEED_RETENTION_DAYS = 30    entries older than this are removed by prune_changes
+CLIENT_INTERVAL = 30
+CLIENT_MAX_INTERVAL = 300
+POLL_INTERVAL = 2
+STREAMING = False
+MAX_WAIT = 25
+RETENTION_DAYS = 30
+BATCH_SIZE = 100
+
+
+def record_changes(kind, action, object_id, description, user_ids, using=None):
+    """
+    Writes one feed entry per user, in a single insert when the surrounding transaction commits.
+    Users deleted by that transaction get no entry, a module deleted with its employee reports to the
+    employee too.
+    :param using: database of the changed rows, whose transaction decides if the entries are written
+    """
+    record_many_changes([(kind, action, object_id, description, user_ids)], using=using)
+
+
+def record_many_changes(changes, using=None):
+    """
+    Same as record_changes for a list of (kind, action, object_id, description, user_ids),
+    all written with one insert, for the bulk operations that bypass the model signals
+    """
+    changes = [(kind, action, object_id, description, {user_id for user_id in user_ids if user_id is not None})
+               for kind, action, object_id, description, user_ids in changes]
+    if any(user_ids for *_, user_ids in changes):
+        transaction.on_commit(lambda: _write_changes(changes), using=using)
+
+
+def _write_changes(changes):
+    existing = set(MyUser.objects.filter(id__in=set().union(*(user_ids for *_, user_ids in changes)))
+                   .values_list('id', flat=True))
+    AssignmentChange.objects.bulk_create([
+        AssignmentChange(user_id=user_id, kind=kind, action=action, object_id=object_id,
+                         description=description[:300])
+        for kind, action, object_id, description, user_ids in changes
+        for user_id in sorted(user_ids & existing)
+    ])
+
+
+def latest_cursor(user):
+    """
+    :return: cursor of the newest entry of the user's feed, 0 when the feed is empty
+    """
+    return (AssignmentChange.objects.filter(user=user).order_by('-id')
+            .values_list('id', flat=True).first() or 0)
+
+
+def changes_after(user, cursor, limit=BATCH_SIZE):
+    """
+    :return: at most `limit` entries of the user's feed newer than the cursor, oldest first
+    """
+    changes = (AssignmentChange.objects.filter(user=user, id__gt=cursor).order_by('id')
+               .values('id', 'kind', 'action', 'object_id', 'description', 'created_at')[:limit])
+    return [dict(change, created_at=change['created_at'].isoformat()) for change in changes]
+
+
+def wait_for_changes(user, cursor, wait):
+    """
+    Polls the user's feed until it has entries after the cursor or `wait` seconds have passed.
+    Each poll is one indexed query, but the request holds its worker for the whole wait.
+    """
+    interval = getattr(settings, 'CHANGE_FEED_POLL_INTERVAL', POLL_INTERVAL)
+    deadline = time.monotonic() + wait
+
+    while True:
+        changes = changes_after(user, cursor)
+        if changes or time.monotonic() + interval > deadline:
+            return changes
+        time.sleep(interval)
+
+
+def prune_changes(days=None):
+    """
+    :return: number of feed entries older than CHANGE_FEED_RETENTION_DAYS that were deleted
+    """
+    if days is None:
+        days = getattr(settings, 'CHANGE_FEED_RETENTION_DAYS', RETENTION_DAYS)
+    deleted, _ = AssignmentChange.objects.filter(created_at__lt=timezone.now() - timedelta(days=days)).delete()
+    return deleted
+
+
+# Signal handlers: a module change goes to its employee, its assignee and the project's team leader,
+# before and after the change, a membership change goes to the member and the team leader.
+
+def _team_leader_ids(project_ids, using):
+    return Project.objects.using(using).filter(id__in=project_ids).values_list('team_leader_id', flat=True)
+
+
+def _module_description(module):
+    return '{} ({})'.format(module.module_name, module.module_code)
+
+
+def module_saved(sender, instance, created, using, **kwargs):
+    previous = getattr(instance, '_previous_assignment', None) or {}  # set by remember_previous_assignment
+    project_ids = {instance.project_id, previous.get('project_id')}
+    recipients = {instance.employee_id, instance.assignee_id, previous.get('employee_id'),
+                  previous.get('assignee_id')}
+    recipients.update(_team_leader_ids(project_ids, using))
+
+    record_changes('module', 'created' if created else 'updated', instance.pk, _module_description(instance),
+                   recipients, using)
+
+
+def module_deleted(sender, instance, using, **kwargs):
+    recipients = {instance.employee_id, instance.assignee_id}
+    recipients.update(_team_leader_ids([instance.project_id], using))
+    record_changes('module', 'deleted', instance.pk, _module_description(instance), recipients, using)
+
+
+def project_saved(sender, instance, created, using, **kwargs):
+    record_changes('project', 'created' if created else 'updated', instance.pk, instance.project_name,
+                   [instance.team_leader_id], using)
+
+
+def membership_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action == 'pre_clear':  # pk_set is empty for clear, remember who or what is being removed
+        if reverse:
+            instance._cleared_ids = list(Project.objects.using(using).filter(team_members=instance)
+                                         .values_list('id', flat=True))
+        else:
+            instance._cleared_ids = list(instance.team_members.values_list('id', flat=True))
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    change = 'added' if action == 'post_add' else 'removed'
+    ids = getattr(instance, '_cleared_ids', []) if action == 'post_clear' else pk_set or []
+
+    if not reverse:  # instance is the project, ids are users
+        record_changes('project', change, instance.pk, instance.project_name,
+                       list(ids) + [instance.team_leader_id], using)
+        return
+
+    # instance is the user, ids are projects
+    for project_id, project_name, team_leader_id in (Project.objects.using(using).filter(id__in=ids)
+                                                     .values_list('id', 'project_name', 'team_leader_id')):
+        record_changes('project', change, project_id, project_name, [instance.pk, team_leader_id], using)
+
+
+post_save.connect(module_saved, sender=Module)
+post_delete.connect(module_deleted, sender=Module)
+post_save.connect(project_saved, sender=Project)
+m2m_changed.connect(membership_changed, sender=Project.team_members.through)
@@ -2,10 +2,11 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.conf import settings
 from django.db.models import Q
-from datetime import datetime
+from datetime import datetime, date, timedelta
 from django.db import transaction
 from django.contrib.auth.models import Group
 from .models import Company, Employee, Project, Module, MyUser
+from .tenancy import companies_in_scope, taken_values
 
 
 class UserRegistrationForm(UserCreationForm):
@@ -124,6 +125,111 @@ class EditEmployeeForm(forms.ModelForm):
         raise forms.ValidationError("Incorrect age. Check the range")
 
 
+class EmployeeFilterForm(forms.Form):
+    """
+    GET parameters of the employee list. Every field is optional, an empty form lists everyone.
+    """
+    FACETS = ('designation', 'gender', 'age', 'salary', 'joined')
+
+    # (value, lower bound, upper bound) bands, upper bound None means no limit
+    AGE_BANDS = (('18-25', 18, 25), ('26-35', 26, 35), ('36-45', 36, 45), ('46-55', 46, 55), ('56-65', 56, 65))
+    SALARY_BANDS = (('0-30000', 0, 30000), ('30000-60000', 30000, 60000), ('60000-100000', 60000, 100000),
+                    ('100000+', 100000, None))
+    JOINED_BANDS = (('0-1', 0, 1), ('1-3', 1, 3), ('3-5', 3, 5), ('5+', 5, None))  # years since joining
+
+    SORT_CHOICES = (
+        ('employee__full_name', 'Name'),
+        ('employee__designation', 'Designation'),
+        ('age', 'Age (youngest first)'),
+        ('-age', 'Age (oldest first)'),
+        ('salary', 'Salary (lowest first)'),
+        ('-salary', 'Salary (highest first)'),
+        ('date_of_joining', 'Joining date (oldest first)'),
+        ('-date_of_joining', 'Joining date (newest first)'),
+    )
+
+    designation = forms.ChoiceField(choices=(('', 'Any'),) + MyUser.DESIGNATION_CHOICES, required=False)
+    gender = forms.ChoiceField(choices=(('', 'Any'),) + Employee.GENDER_CHOICES, required=False)
+    age = forms.ChoiceField(choices=[('', 'Any')] + [(band[0], band[0]) for band in AGE_BANDS], required=False)
+    salary = forms.ChoiceField(choices=[('', 'Any')] + [(band[0], band[0]) for band in SALARY_BANDS],
+                               required=False)
+    joined = forms.ChoiceField(choices=[('', 'Any')] + [(band[0], band[0] + ' years ago') for band in JOINED_BANDS],
+                               required=False)
+    joined_from = forms.DateField(input_formats=settings.DATE_INPUT_FORMATS, required=False,
+                                  help_text='It must be in DD-MM-YYYY format.')
+    joined_to = forms.DateField(input_formats=settings.DATE_INPUT_FORMATS, required=False,
+                                help_text='It must be in DD-MM-YYYY format.')
+    sort = forms.ChoiceField(choices=(('', 'Default'),) + SORT_CHOICES, required=False)
+
+    def facet_choices(self, name):
+        """
+        :return: (value, label) pairs of a facet, without the empty 'Any' choice
+        """
+        return [choice for choice in self.fields[name].choices if choice[0]]
+
+    def facet_q(self, name, value):
+        """
+        :return: Q object selecting the employees that fall in the given value of a facet
+        """
+        if name == 'designation':
+            return Q(employee__designation=value)
+
+        if name == 'gender':
+            return Q(gender=value)
+
+        if name == 'age':
+            low, high = self._band(self.AGE_BANDS, value)
+            return Q(age__gte=low, age__lte=high)
+
+        if name == 'salary':
+            low, high = self._band(self.SALARY_BANDS, value)
+            if high is None:
+                return Q(salary__gte=low)
+            return Q(salary__gte=low, salary__lt=high)
+
+        if name == 'joined':
+            low, high = self._band(self.JOINED_BANDS, value)
+            today = date.today()
+            query = Q(date_of_joining__lte=today - timedelta(days=365 * low))
+            if high is not None:
+                query &= Q(date_of_joining__gt=today - timedelta(days=365 * high))
+            return query
+
+        raise ValueError("Unknown facet {}".format(name))
+
+    def get_filters(self):
+        """
+        :return: dict of filter name -> Q object for every filter the user has set,
+        facets are keyed by their field name so they can be left out when counting that facet
+        """
+        if not self.is_valid():
+            return {}
+
+        filters = {}
+        for name in self.FACETS:
+            if self.cleaned_data.get(name):
+                filters[name] = self.facet_q(name, self.cleaned_data[name])
+
+        if self.cleaned_data.get('joined_from'):
+            filters['joined_from'] = Q(date_of_joining__gte=self.cleaned_data['joined_from'])
+        if self.cleaned_data.get('joined_to'):
+            filters['joined_to'] = Q(date_of_joining__lte=self.cleaned_data['joined_to'])
+
+        return filters
+
+    def get_ordering(self):
+        if self.is_valid() and self.cleaned_data.get('sort'):
+            return self.cleaned_data['sort'], 'id'
+        return 'id',
+
+    @staticmethod
+    def _band(bands, value):
+        for band in bands:
+            if band[0] == value:
+                return band[1], band[2]
+        raise ValueError("Unknown band {}".format(value))
+
+
 class AddEditProjectForm(forms.ModelForm):
 
     team_leader = forms.ModelChoiceField(queryset=MyUser.objects.filter(designation='Team Leader'),
@@ -135,6 +241,10 @@ class AddEditProjectForm(forms.ModelForm):
         model = Project
         fields = '__all__'
 
+    def __init__(self, *args, **kwargs):
+        super(AddEditProjectForm, self).__init__(*args, **kwargs)
+        self.fields['company'].queryset = companies_in_scope()
+
     def save(self, commit=True):
         project = super(AddEditProjectForm, self).save(commit=False)
         if project.team_leader_id is None:
@@ -160,6 +270,15 @@ class AddEditProjectForm(forms.ModelForm):
         data = self.cleaned_data['team_leader']
         return data
 
+    def clean_project_code(self):
+        """
+        :return: error when another project uses the code, in any company database
+        """
+        data = self.cleaned_data['project_code']
+        if taken_values(Project, 'project_code', [data], self.instance):
+            raise forms.ValidationError("There is already a project with code: %s" % data)
+        return data
+
     def clean_project_name(self):
         """
         https://stackoverflow.com/questions/20564856/django-exclude-self-from-queryset-for-validation
@@ -167,7 +286,7 @@ class AddEditProjectForm(forms.ModelForm):
         """
         data = self.cleaned_data['project_name'].title()
         comp = self.cleaned_data.get('company')
-        qs = Project.objects.filter(Q(company=comp) & Q(project_name=data))
+        qs = Project.scoped.filter(Q(company=comp) & Q(project_name=data))
         if self.instance.pk is not None:
             qs = qs.exclude(pk=self.instance.pk)
         if qs.exists():
@@ -202,6 +321,7 @@ class AddEditModuleForm(forms.ModelForm):
 
         self.logged_user = kwargs.pop('logged_user')  # accessing the request.user in current request coming from view file
         super(AddEditModuleForm, self).__init__(*args, **kwargs)
+        self.fields['project'].queryset = Project.scoped.all()
 
         if self.instance.pk is None:
             self.fields['assignee_by'].initial = self.logged_user
@@ -222,6 +342,25 @@ class AddEditModuleForm(forms.ModelForm):
         data = self.cleaned_data.get('module_name').title()
         return data
 
+    def clean_module_code(self):
+        """
+        :return: error when another live module uses the code, in any company database
+        """
+        data = self.cleaned_data['module_code']
+        if taken_values(Module, 'module_code', [data], self.instance):
+            raise forms.ValidationError("There is already a module with code: %s" % data)
+        return data
+
+    def clean_employee(self):
+        """
+        :return: error when the employee already works on another module, in any company database,
+        an employee has one module at a time
+        """
+        data = self.cleaned_data['employee']
+        if taken_values(Module, 'employee', [data.pk], self.instance):
+            raise forms.ValidationError("%s already works on a module" % data)
+        return data
+
     def clean_end_date(self):
         """
         to do date comparison
@@ -234,3 +373,59 @@ class AddEditModuleForm(forms.ModelForm):
         if end_date <= start_date:
             raise forms.ValidationError("End date and time should be later than start date")
         return end_date
+
+
+class BulkModuleForm(forms.Form):
+    """
+    Changes applied to every selected module at once by bulk_change_modules. New employees are given per module
+    in the employee_<module id> inputs, as email addresses.
+    """
+    modules = forms.ModelMultipleChoiceField(queryset=Module.objects.none(), widget=forms.CheckboxSelectMultiple)
+    project = forms.ModelChoiceField(queryset=Project.objects.none(), required=False, empty_label='Keep project')
+    assignee = forms.ModelChoiceField(queryset=MyUser.objects.filter(designation='Team Leader'), required=False,
+                                      empty_label='Keep team leader', label='Team leader')
+    shift_days = forms.IntegerField(required=False, help_text='Moves start and end dates, negative moves them earlier.')
+    extend_days = forms.IntegerField(required=False, help_text='Moves the end date only.')
+
+    def __init__(self, *args, **kwargs):
+
+        modules = kwargs.pop('modules')  # the modules the logged user may change
+        super(BulkModuleForm, self).__init__(*args, **kwargs)
+        self.fields['modules'].queryset = modules
+        self.fields['project'].queryset = Project.scoped.all()
+
+    def clean(self):
+        """
+        :return: cleaned data with 'employees', dict of module id -> id of the user with the entered email,
+        None when no user has it
+        """
+        cleaned_data = super(BulkModuleForm, self).clean()
+        selected = {module.pk for module in cleaned_data.get('modules') or ()}
+
+        emails = {}
+        for name, value in self.data.items():
+            module_id = name[len('employee_'):]
+            if name.startswith('employee_') and value.strip() and module_id.isdigit() and int(module_id) in selected:
+                emails[int(module_id)] = value.strip().lower()
+
+        users = dict(MyUser.objects.filter(email__in=emails.values()).values_list('email', 'id'))
+        cleaned_data['employees'] = {module_id: users.get(email) for module_id, email in emails.items()}
+
+        if not (cleaned_data['employees'] or cleaned_data.get('project') or cleaned_data.get('assignee') or
+                cleaned_data.get('shift_days') or cleaned_data.get('extend_days')):
+            raise forms.ValidationError("Choose something to change")
+        return cleaned_data
+
+    def get_changes(self):
+        """
+        :return: keyword arguments of bulk_change_modules
+        """
+        shift_days = self.cleaned_data.get('shift_days')
+        extend_days = self.cleaned_data.get('extend_days')
+        return {
+            'project': self.cleaned_data.get('project'),
+            'assignee': self.cleaned_data.get('assignee'),
+            'employees': self.cleaned_data['employees'],
+            'shift': timedelta(days=shift_days) if shift_days else None,
+            'extend': timedelta(days=extend_days) if extend_days else None,
+        }
@@ -0,0 +1,255 @@
+import re
+
+from django.apps import apps
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import Col
+from django.db.models.sql.where import OR, WhereNode
+from django.test import RequestFactory
+
+from jira.forms import AddEditProjectForm, AddEditModuleForm
+from jira.models import Company, Project, Module, MyUser, AssignmentChange
+from jira.sample_data import create_sample_data
+from jira.tenancy import company_scope, partitioned_company_ids
+from jira.views import ProjectView, ModuleView, EmployeeView, ArchivedModuleView
+
+EQUALITY_LOOKUPS = ('exact', 'in', 'isnull')
+# case-insensitive lookups compile to UPPER() of the column, the others match anywhere in it, no btree serves them
+UNINDEXABLE_LOOKUPS = ('iexact', 'istartswith', 'contains', 'icontains', 'endswith', 'iendswith', 'regex', 'iregex',
+                       'search')
+
+
+class Command(BaseCommand):
+    help = ("Builds the querysets of the jira views and forms against generated data, EXPLAINs each one, "
+            "flags full scans and temporary sorts and proposes indexes")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=2000, help='size of the generated dataset')
+        parser.add_argument('--verbose-plans', action='store_true', help='print the full plan of every query')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql', 'mysql'):
+            raise CommandError('EXPLAIN parsing is not implemented for {}'.format(connection.vendor))
+
+        # the dataset only lives inside this transaction
+        with transaction.atomic():
+            create_sample_data(companies=20, projects_per_company=10, employees=options['employees'])
+            with connection.cursor() as cursor:
+                if connection.vendor in ('sqlite', 'postgresql'):
+                    cursor.execute('ANALYZE')  # gives the planner real row counts
+                proposals = self.advise(cursor, options['verbose_plans'])
+            transaction.set_rollback(True)
+
+        self.stdout.write('\nProposed indexes')
+        if not proposals:
+            self.stdout.write('  none, every flagged query is already covered by an index')
+        for model, fields in sorted(proposals, key=lambda proposal: (proposal[0]._meta.label, proposal[1])):
+            self.stdout.write('  {}.Meta.indexes: models.Index(fields={!r})'.format(model.__name__, list(fields)))
+
+    def cases(self):
+        """
+        :return: (label, queryset) of every query the views and forms run, with the role branches separately.
+        The list querysets come from the views' own get_queryset(), for one user per role group, inside the
+        company scope CompanyScopeMiddleware sets, so the company filters of the scoped managers are explained too.
+        """
+        project = (Project.objects.exclude(company_id__in=partitioned_company_ids())
+                   .select_related('company').order_by('id').first())
+        module = (Module.objects.filter(project__company=project.company_id)
+                  .select_related('project__team_leader', 'employee').order_by('id').first())
+        leader = module.project.team_leader
+        worker = module.employee
+        admin = MyUser.objects.create(email='advisor@example.com', username='advisor', full_name='Advisor',
+                                      designation='Admin')
+        for user, group in ((admin, 'Admin Group'), (leader, 'Team Leader Group'),
+                            (worker, 'Low Level Employee Group')):
+            Group.objects.get_or_create(name=group)[0].user_set.add(user)
+
+        with company_scope(project.company_id):
+            return [
+                ('group check in every view', admin.groups.filter(name='Admin Group')),
+                ('ProjectView admin', view_queryset(ProjectView, admin)),
+                ('ProjectView team leader', view_queryset(ProjectView, leader)),
+                ('ProjectView employee', view_queryset(ProjectView, worker)),
+                ('ProjectUpdateView modules', Module.scoped.filter(project=project.pk)),
+                ('ModuleView admin', view_queryset(ModuleView, admin)),
+                ('ModuleView team leader', view_queryset(ModuleView, leader)),
+                # the employee branch runs .first() of this
+                ('ModuleView employee', Module.scoped.filter(employee=worker).order_by('pk')[:1]),
+                ('EmployeeView filtered and sorted',
+                 view_queryset(EmployeeView, admin, {'designation': 'Employee', 'age': '26-35', 'sort': '-salary'})),
+                ('EmployeeUpdateView employee projects', Project.scoped.filter(team_members=worker)),
+                ('AddEditProjectForm team_leader choices', AddEditProjectForm.base_fields['team_leader'].queryset),
+                ('AddEditProjectForm team_members choices', AddEditProjectForm.base_fields['team_members'].queryset),
+                ('AddEditModuleForm employee choices', AddEditModuleForm.base_fields['employee'].queryset),
+                ('UserRegistrationForm.clean_email', MyUser.objects.filter(email=worker.email)),
+                ('AddEditCompanyForm.clean_company_name',
+                 Company.objects.filter(company_name=project.company.company_name)),
+                ('AddEditProjectForm.clean_project_name',
+                 Project.scoped.filter(Q(company=project.company_id) & Q(project_name=project.project_name))
+                 .exclude(pk=project.pk)),
+                ('ArchivedModuleView search admin', view_queryset(ArchivedModuleView, admin, {'q': 'Sample'})),
+                ('ArchivedModuleView search employee', view_queryset(ArchivedModuleView, worker, {'q': 'Sample'})),
+                ('assignment_changes feed', AssignmentChange.objects.filter(user=worker, id__gt=0).order_by('id')),
+            ]
+
+    def advise(self, cursor, verbose_plans):
+        """
+        :return: set of (model, index fields) proposals
+        """
+        proposals = set()
+
+        for label, queryset in self.cases():
+            sql, params = queryset.query.sql_with_params()
+            plan = self.explain(cursor, sql, params)
+            scans, temp_sort = self.parse_plan(plan)
+            columns = query_columns(queryset.query)
+
+            flags = ['full scan of {}'.format(table) for table in sorted(scans)]
+            if temp_sort:
+                flags.append('temporary sort')
+            self.stdout.write('{:<45} {}'.format(label, ', '.join(flags) or 'ok'))
+
+            if verbose_plans or flags:
+                self.stdout.write('    ' + sql % tuple(repr(param) for param in params))
+                for line in plan:
+                    self.stdout.write('      | ' + line)
+
+            for table in sorted(scans) + ([queryset.model._meta.db_table] if temp_sort else []):
+                proposal = propose_index(cursor, table, columns.get(table))
+                if proposal is None:
+                    if table in scans and not columns.get(table):
+                        self.stdout.write('    {} has no filter or sort, the scan is expected'.format(table))
+                    continue
+                model, fields, covered = proposal
+                if covered:
+                    self.stdout.write('    {} is already indexed on {}, the planner chose another plan'.format(
+                        table, ', '.join(fields)))
+                else:
+                    self.stdout.write('    propose {}: models.Index(fields={!r})'.format(model.__name__, fields))
+                    proposals.add((model, tuple(fields)))
+
+        return proposals
+
+    def explain(self, cursor, sql, params):
+        """
+        :return: plan as a list of text lines
+        """
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+        cursor.execute('EXPLAIN ' + sql, params)
+        if connection.vendor == 'postgresql':
+            return [row[0] for row in cursor.fetchall()]
+
+        names = [column[0] for column in cursor.description]
+        return ['table={table} type={type} key={key} rows={rows} extra={Extra}'.format(**dict(zip(names, row)))
+                for row in cursor.fetchall()]
+
+    def parse_plan(self, plan):
+        """
+        :return: (set of fully scanned tables, whether the plan sorts into a temporary structure)
+        """
+        scans, temp_sort = set(), False
+
+        for line in plan:
+            if connection.vendor == 'sqlite':
+                match = re.match(r'\s*SCAN (?:TABLE )?(\w+)', line)
+                if match and 'USING' not in line:
+                    scans.add(match.group(1))
+                temp_sort = temp_sort or 'USE TEMP B-TREE' in line
+
+            elif connection.vendor == 'postgresql':
+                match = re.search(r'Seq Scan on (\w+)', line)
+                if match:
+                    scans.add(match.group(1))
+                temp_sort = temp_sort or re.match(r'\s*(->\s+)?Sort\b', line) is not None
+
+            else:
+                match = re.match(r'table=(\w+) type=ALL\b', line)
+                if match:
+                    scans.add(match.group(1))
+                temp_sort = temp_sort or 'Using filesort' in line or 'Using temporary' in line
+
+        return scans, temp_sort
+
+
+def view_queryset(view_class, user, params=None):
+    """
+    :return: queryset the list view builds for a GET request of the user with the query parameters
+    """
+    request = RequestFactory().get('/', params or {})
+    request.user = user
+    view = view_class()
+    view.request, view.args, view.kwargs = request, (), {}
+    return view.get_queryset()
+
+
+def query_columns(query):
+    """
+    :return: dict of table -> {'equality': [...], 'range': [...], 'order': [...]} columns used by the query
+    """
+    columns = {}
+
+    def add(table, kind, column):
+        table_columns = columns.setdefault(table, {'equality': [], 'range': [], 'order': []})
+        if column not in table_columns[kind]:
+            table_columns[kind].append(column)
+
+    def walk(node):
+        if node.connector == OR and len(node.children) > 1:
+            return  # one index cannot serve both sides of an OR
+        for child in node.children:
+            if isinstance(child, WhereNode):
+                walk(child)
+            elif isinstance(getattr(child, 'lhs', None), Col) and child.lookup_name not in UNINDEXABLE_LOOKUPS:
+                table = query.alias_map[child.lhs.alias].table_name
+                kind = 'equality' if child.lookup_name in EQUALITY_LOOKUPS and not node.negated else 'range'
+                add(table, kind, child.lhs.target.column)
+
+    walk(query.where)
+
+    ordering = query.order_by or (query.get_meta().ordering if query.default_ordering else ())
+    for name in ordering:
+        name = str(name).lstrip('-')
+        if '__' in name or name == '?':
+            continue  # ordering through a relation is not indexable on the base table
+        field = query.get_meta().pk if name == 'pk' else query.get_meta().get_field(name)
+        add(query.get_meta().db_table, 'order', field.column)
+
+    return columns
+
+
+def propose_index(cursor, table, columns):
+    """
+    :return: (model, index fields, whether an existing index already starts with them) or None
+    when the query gives nothing to index on the table
+    """
+    if not columns:
+        return None
+
+    model = next((model for model in apps.get_models(include_auto_created=True)
+                  if model._meta.db_table == table), None)
+    if model is None:
+        return None
+
+    # equality columns first, then the sort columns, an index can serve the ORDER BY only when
+    # no range comes before it, otherwise the first range column
+    wanted = columns['equality'] + (columns['order'] or columns['range'][:1])
+    wanted = [column for index, column in enumerate(wanted) if column not in wanted[:index]]
+    if len(wanted) > 1 and wanted[-1] == model._meta.pk.column:
+        wanted.pop()  # the primary key is a tie breaker, every index already ends with the row id
+    if not wanted:
+        return None
+
+    by_column = {field.column: field.name for field in model._meta.concrete_fields}
+    fields = [by_column[column] for column in wanted]
+
+    existing = [constraint['columns'] for constraint in
+                connection.introspection.get_constraints(cursor, table).values()
+                if constraint.get('index') or constraint.get('unique') or constraint.get('primary_key')]
+    covered = any(index_columns[:len(wanted)] == wanted for index_columns in existing)
+
+    return model, fields, covered
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from jira.archive import archive_modules, archive_cutoff, ARCHIVE_CHUNK_SIZE
+from jira.models import Module
+from jira.tenancy import all_databases
+
+
+class Command(BaseCommand):
+    help = "Moves modules that ended more than ARCHIVE_MODULES_AFTER_DAYS ago into the archive table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='overrides ARCHIVE_MODULES_AFTER_DAYS')
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE, help='modules per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='only count the modules that would be archived')
+        parser.add_argument('--database', default=None, help='only this database, default is every company database')
+
+    def handle(self, *args, **options):
+        for database in [options['database']] if options['database'] else all_databases():
+            if options['dry_run']:
+                count = Module.objects.using(database).filter(end_date__lt=archive_cutoff(options['days'])).count()
+                self.stdout.write('{}: {} modules would be archived'.format(database, count))
+                continue
+
+            archived = archive_modules(days=options['days'], chunk_size=options['chunk_size'], using=database)
+            self.stdout.write('{}: {} modules archived'.format(database, archived))
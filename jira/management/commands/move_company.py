@@ -0,0 +1,126 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+
+from jira.archive import reserve_archived_ids
+from jira.models import Company, Project, Module, ArchivedModule, ProjectCostSummary
+from jira.snapshot import signals_disabled
+from jira.tenancy import database_for_company, mirror_shared_rows
+
+MOVE_CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = ("Moves the projects, memberships, modules, archived modules and cost summaries of a company to "
+            "another database in chunks. Point JIRA_COMPANY_DATABASES at the new database once it is done")
+
+    def add_arguments(self, parser):
+        parser.add_argument('company_id', type=int)
+        parser.add_argument('database', help="alias in DATABASES to move the company to, 'default' moves it back")
+        parser.add_argument('--from', dest='source', default=None,
+                            help='database the company is in now, default is the one JIRA_COMPANY_DATABASES gives')
+        parser.add_argument('--chunk-size', type=int, default=MOVE_CHUNK_SIZE, help='rows per transaction')
+
+    def handle(self, *args, **options):
+        company_id, target = options['company_id'], options['database']
+        source = options['source'] or database_for_company(company_id)
+
+        for alias in (source, target):
+            if alias not in connections.databases:
+                raise CommandError('{} is not in DATABASES'.format(alias))
+        if source == target:
+            raise CommandError('company {} is already in {}'.format(company_id, target))
+        if not Company.objects.using(DEFAULT_DB_ALIAS).filter(pk=company_id).exists():
+            raise CommandError('company {} does not exist'.format(company_id))
+
+        self.check_collisions(company_id, source, target, options['chunk_size'])
+
+        # model signals are off, moving rows is not a change of the assignments or the costs
+        with signals_disabled():
+            # every company, user and employee, so rows of the moved company can point to any of them later
+            mirror_shared_rows(target, options['chunk_size'])
+            moved = self.move_rows(company_id, source, target, options['chunk_size'])
+
+        for label, rows in moved:
+            self.stdout.write('{:<40}{:>10}'.format(label, rows))
+        self.stdout.write("company {} moved from {} to {}, set JIRA_COMPANY_DATABASES[{}] = '{}'".format(
+            company_id, source, target, company_id, target))
+
+    def partitioned_models(self):
+        return [Project, Project.team_members.through, Module, ArchivedModule, ProjectCostSummary]
+
+    def check_collisions(self, company_id, source, target, chunk_size):
+        """
+        Ids are only unique within one database: stops before anything is copied when an id of the company's
+        rows is already used in the target by another company's row
+        """
+        for model in self.partitioned_models():
+            queryset = model._base_manager.using(source).filter(self.company_filter(model, company_id))
+            ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+            for start in range(0, len(ids), chunk_size):
+                self.raise_on_collision(model, company_id, target, ids[start:start + chunk_size])
+
+    def raise_on_collision(self, model, company_id, target, ids):
+        """
+        :return: the ids that are already in the target as rows of the company, copied by an earlier run
+        """
+        rows = model._base_manager.using(target).filter(pk__in=ids)
+        existing = set(rows.values_list('pk', flat=True))
+        copied = set(rows.filter(self.company_filter(model, company_id)).values_list('pk', flat=True))
+
+        if existing - copied:
+            raise CommandError('{} ids {} of company {} are used by other rows in {}, the company cannot be moved '
+                               'there'.format(model._meta.label, sorted(existing - copied), company_id, target))
+        return copied
+
+    def move_rows(self, company_id, source, target, chunk_size):
+        """
+        Copies every partitioned table in chunks, one transaction on the target per chunk, then deletes the
+        rows from the source. Ids already in the target as rows of the company are skipped, so an interrupted
+        move is finished by running the command again, ids used there by other rows stop the move.
+        :return: list of (model label, rows copied)
+        """
+        models = self.partitioned_models()
+        moved = []
+
+        for model in models:
+            queryset = model._base_manager.using(source).filter(self.company_filter(model, company_id))
+            copied, last_id = 0, 0
+
+            while True:
+                rows = list(queryset.filter(pk__gt=last_id).order_by('pk')[:chunk_size])
+                if not rows:
+                    break
+                last_id = rows[-1].pk
+
+                with transaction.atomic(using=target):
+                    copied_before = self.raise_on_collision(model, company_id, target, [row.pk for row in rows])
+                    new_rows = [row for row in rows if row.pk not in copied_before]
+                    model._base_manager.using(target).bulk_create(new_rows)
+                copied += len(new_rows)
+
+            moved.append((model._meta.label, copied))
+
+        # rows created in the target later must not reuse the copied ids, nor the ids of the archived modules
+        with connections[target].cursor() as cursor:
+            for sql in connections[target].ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+        reserve_archived_ids(target)
+
+        for model in reversed(models):
+            queryset = model._base_manager.using(source).filter(self.company_filter(model, company_id))
+            while True:
+                ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+                if not ids:
+                    break
+                with transaction.atomic(using=source):
+                    model._base_manager.using(source).filter(pk__in=ids).delete()
+
+        return moved
+
+    @staticmethod
+    def company_filter(model, company_id):
+        if model in (Project, ProjectCostSummary):
+            return Q(company_id=company_id)
+        return Q(project__company_id=company_id)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from jira.changes import prune_changes
+
+
+class Command(BaseCommand):
+    help = "Deletes change feed entries older than CHANGE_FEED_RETENTION_DAYS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='overrides CHANGE_FEED_RETENTION_DAYS')
+
+    def handle(self, *args, **options):
+        self.stdout.write('{} change feed entries deleted'.format(prune_changes(options['days'])))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from jira.reports import refresh_project_costs, REFRESH_CHUNK_SIZE
+from jira.tenancy import all_databases
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the project cost summaries, needed once after install, later changes refresh them automatically"
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_ids', nargs='*', type=int, help='only these projects, default is all')
+        parser.add_argument('--chunk-size', type=int, default=REFRESH_CHUNK_SIZE)
+        parser.add_argument('--database', default=None, help='only this database, default is every company database')
+
+    def handle(self, *args, **options):
+        for database in [options['database']] if options['database'] else all_databases():
+            written = refresh_project_costs(options['project_ids'] or None, chunk_size=options['chunk_size'],
+                                            using=database)
+            self.stdout.write('{}: {} project cost summaries written'.format(database, written))
@@ -0,0 +1,110 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.forms import AuthenticationForm
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.backends.django import DjangoTemplates
+from django.test import RequestFactory
+
+from jira.forms import (AddEditCompanyForm, EditEmployeeForm, AddEditProjectForm, AddEditModuleForm,
+                        UserRegistrationForm)
+from jira.models import Company, Employee, Project, Module, MyUser
+from jira.sample_data import create_sample_data
+
+PLAIN_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+CACHED_LOADERS = [
+    ('django.template.loaders.cached.Loader', PLAIN_LOADERS),
+]
+
+
+class Command(BaseCommand):
+    help = "Renders every page template with and without the cached loader and reports time and output size"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='renders per template and loader')
+        parser.add_argument('--rows', type=int, default=50, help='rows shown on each list page')
+
+    def handle(self, *args, **options):
+        # sample rows are created inside a transaction that is always rolled back
+        with transaction.atomic():
+            create_sample_data(employees=max(options['rows'], 20))
+            self.run(options['iterations'], options['rows'])
+            transaction.set_rollback(True)
+
+    def run(self, iterations, rows):
+        user = MyUser.objects.create(email='benchmark@example.com', username='benchmark',
+                                     full_name='Benchmark User', designation='Admin')
+        request = RequestFactory().get('/')
+        request.user = user
+
+        engines = [('uncached', self.engine(PLAIN_LOADERS)), ('cached', self.engine(CACHED_LOADERS))]
+        contexts = self.contexts(user, rows)
+
+        self.stdout.write('{:<26}{:>14}{:>14}{:>12}'.format('template', 'uncached ms', 'cached ms', 'bytes'))
+        totals = {'uncached': 0.0, 'cached': 0.0, 'bytes': 0}
+
+        for name, context in contexts.items():
+            timings = {}
+            for label, engine in engines:
+                size = len(engine.get_template(name).render(context, request).encode())  # warm-up
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    engine.get_template(name).render(context, request)
+                timings[label] = (time.perf_counter() - start) * 1000 / iterations
+                totals[label] += timings[label]
+            totals['bytes'] += size
+            self.stdout.write('{:<26}{:>14.3f}{:>14.3f}{:>12}'.format(
+                name, timings['uncached'], timings['cached'], size))
+
+        self.stdout.write('{:<26}{:>14.3f}{:>14.3f}{:>12}'.format(
+            'total', totals['uncached'], totals['cached'], totals['bytes']))
+
+    def engine(self, loaders):
+        options = settings.TEMPLATES[0].get('OPTIONS', {})
+        return DjangoTemplates({
+            'NAME': 'benchmark',
+            'DIRS': settings.TEMPLATES[0].get('DIRS', []),
+            'APP_DIRS': False,
+            'OPTIONS': {
+                'loaders': loaders,
+                'context_processors': options.get('context_processors', []),
+                'libraries': options.get('libraries', {}),
+            },
+        })
+
+    def contexts(self, user, rows):
+        """
+        :return: one context per page template, list rows are fetched up front so only rendering is timed
+        """
+        companies = list(Company.objects.all()[:rows])
+        employees = list(Employee.objects.select_related('employee')[:rows])
+        projects = list(Project.objects.select_related('company', 'team_leader')
+                        .prefetch_related('team_members')[:rows])
+        modules = list(Module.objects.select_related('project__company', 'employee', 'assignee')[:rows])
+
+        return {
+            'company_list.html': {'companies': companies},
+            'employee_list_view.html': {'employees': employees},
+            'project_list_view.html': {'projects': projects},
+            'module_list_view.html': {'modules': modules},
+            'add_company.html': {'form': AddEditCompanyForm()},
+            'add_project.html': {'form': AddEditProjectForm()},
+            'add_module.html': {'form': AddEditModuleForm(logged_user=user)},
+            'update_company.html': {'form': AddEditCompanyForm(instance=companies[0])},
+            'update_employee.html': {'form': EditEmployeeForm(instance=employees[0]),
+                                     'projects': projects[:5]},
+            'update_project.html': {'form': AddEditProjectForm(instance=projects[0]),
+                                    'modules': modules[:5]},
+            'update_module.html': {'form': AddEditModuleForm(instance=modules[0], logged_user=user)},
+            'delete_employee.html': {'object': employees[0]},
+            'delete_project.html': {'object': projects[0]},
+            'delete_module.html': {'object': modules[0]},
+            'register_form.html': {'form': UserRegistrationForm()},
+            'login.html': {'form': AuthenticationForm()},
+            'logout.html': {},
+        }
@@ -0,0 +1,88 @@
+import time
+from contextlib import ExitStack
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction
+
+from jira.archive import reserve_archived_ids
+from jira.reports import refresh_project_costs
+from jira.snapshot import dependent_models, read_snapshot, signals_disabled, snapshot_models
+from jira.tenancy import all_databases, mirror_shared_rows
+
+
+class Command(BaseCommand):
+    help = ("Loads a file written by the snapshot command into every company database with bulk inserts, "
+            "model signals disabled and constraint checks deferred to the end")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='snapshot file to read')
+        parser.add_argument('--flush', action='store_true',
+                            help='delete the existing rows of the snapshot tables, and of every table that '
+                                 'points at them, first, in every database')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='rows per INSERT statement, default is the largest the database allows')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        models = snapshot_models()
+        dependents = dependent_models(models)
+        databases = all_databases()
+        restored = {}
+
+        try:
+            with open(options['path'], 'rb') as stream, ExitStack() as transactions, signals_disabled():
+                for database in databases:
+                    transactions.enter_context(transaction.atomic(using=database))
+
+                with ExitStack() as checks_disabled:
+                    for database in databases:
+                        checks_disabled.enter_context(connections[database].constraint_checks_disabled())
+
+                    if options['flush']:
+                        for database in databases:
+                            self.flush(database, dependents + list(reversed(models)))
+
+                    for database, label, names, rows in read_snapshot(stream):
+                        if database not in databases:
+                            raise CommandError('The snapshot has rows of database {}, which is not a company '
+                                               'database here'.format(database))
+                        model = apps.get_model(label)
+                        objects = [model(**dict(zip(names, row))) for row in rows]
+                        model._base_manager.using(database).bulk_create(objects, batch_size=options['batch_size'])
+                        restored[database, label] = restored.get((database, label), 0) + len(objects)
+
+                    # the snapshot holds the shared rows once, the company databases get their mirrors again
+                    for database in databases:
+                        mirror_shared_rows(database)
+
+                for database in databases:
+                    connection = connections[database]
+                    # same as loaddata: check the foreign keys once, after every table is in, rows of the
+                    # dependent tables may point at rows the snapshot did not bring back
+                    connection.check_constraints(table_names=[model._meta.db_table for model in models + dependents])
+
+                    with connection.cursor() as cursor:
+                        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                            cursor.execute(sql)
+                    reserve_archived_ids(database)  # the reset only sees the live modules
+
+        except (OSError, ValueError) as e:
+            raise CommandError('Could not restore {}: {}'.format(options['path'], e))
+
+        for database in databases:
+            refresh_project_costs(using=database)  # the cost summaries are derived data and are not in the snapshot
+
+        for (database, label), rows in restored.items():
+            self.stdout.write('{:<10}{:<40}{:>10}'.format(database, label, rows))
+        self.stdout.write('snapshot restored in {:.2f}s'.format(time.perf_counter() - start))
+
+    def flush(self, database, models):
+        """
+        :param models: models to empty, children before their parents
+        """
+        connection = connections[database]
+        with connection.cursor() as cursor:
+            for model in models:
+                cursor.execute('DELETE FROM {}'.format(connection.ops.quote_name(model._meta.db_table)))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from jira.snapshot import write_snapshot, CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = ("Writes companies, projects, modules, users and employees of every company database "
+            "to a compact binary snapshot file")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='snapshot file to write')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='rows per compressed chunk')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        with open(options['path'], 'wb') as stream:
+            written = write_snapshot(stream, chunk_size=options['chunk_size'])
+
+        for (database, label), rows in written.items():
+            self.stdout.write('{:<10}{:<40}{:>10}'.format(database, label, rows))
+        self.stdout.write('snapshot written in {:.2f}s'.format(time.perf_counter() - start))
@@ -0,0 +1,183 @@
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .models import Company
+from .tenancy import company_scope
+
+# add 'jira.middleware.ProfilingMiddleware' to MIDDLEWARE in settings.py, after AuthenticationMiddleware
+# JIRA_PROFILE_SAMPLE_RATE = 0        percent of all requests profiled without asking, 0 turns sampling off
+# JIRA_PROFILE_DIR = '/var/tmp/jira'  where the profiles are saved, default is <tmp>/jira-profiles
+# JIRA_PROFILE_INTERVAL = 0.005       seconds between two stack samples
+
+# add 'jira.middleware.CompanyScopeMiddleware' to MIDDLEWARE in settings.py, after SessionMiddleware
+COMPANY_SESSION_KEY = 'jira_company_id'
+
+# numbers the profiles of this process, so requests profiled in the same second on other threads get their own files
+_profile_counter = itertools.count(1)
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the call stack of one thread at a fixed interval and counts identical stacks,
+    which is the collapsed format read by flamegraph.pl and speedscope.
+    """
+    def __init__(self, thread_id, interval):
+        super(StackSampler, self).__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append('{} ({})'.format(code.co_name, code.co_filename).replace(';', ':'))
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class QueryLog:
+    """
+    Database execute wrapper that records every SQL statement with its duration
+    """
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((time.perf_counter() - start, context['connection'].alias, sql))
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a request when an Admin Group user asks for it with ?profile=1 or the header 'X-Profile: 1',
+    or when the request is picked by JIRA_PROFILE_SAMPLE_RATE. Every profiled request saves
+    <id>.collapsed (sampled stacks), <id>.prof (cProfile data for pstats/snakeviz) and
+    <id>.txt (SQL and functions ranked by time) in JIRA_PROFILE_DIR and returns the id in 'X-Profile-Id'.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'JIRA_PROFILE_SAMPLE_RATE', 0)
+        self.interval = getattr(settings, 'JIRA_PROFILE_INTERVAL', 0.005)
+        self.directory = getattr(settings, 'JIRA_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'jira-profiles'))
+
+    def __call__(self, request):
+        if self.should_profile(request):
+            return self.profile(request)
+        return self.get_response(request)
+
+    def should_profile(self, request):
+        if request.GET.get('profile') == '1' or request.META.get('HTTP_X_PROFILE') == '1':
+            user = getattr(request, 'user', None)
+            return user is not None and user.is_authenticated and (
+                user.is_superuser or user.groups.filter(name='Admin Group').exists())
+
+        return self.sample_rate > 0 and random.random() * 100 < self.sample_rate
+
+    def profile(self, request):
+        profiler = cProfile.Profile()
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        query_log = QueryLog()
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(query_log))
+
+            start = time.perf_counter()
+            sampler.start()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+                if hasattr(response, 'render') and callable(response.render):
+                    response = response.render()  # template rendering belongs to the profile too
+            finally:
+                profiler.disable()
+                sampler.stop()
+            elapsed = time.perf_counter() - start
+
+        profile_id = self.save(request, response, elapsed, profiler, sampler, query_log)
+        response['X-Profile-Id'] = profile_id
+        return response
+
+    def save(self, request, response, elapsed, profiler, sampler, query_log):
+        """
+        :return: profile id, the common name of the saved files
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'root'
+        profile_id = '{}-{}-{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'), slug, os.getpid(),
+                                          next(_profile_counter))
+        path = os.path.join(self.directory, profile_id)
+
+        with open(path + '.collapsed', 'w') as collapsed:
+            for stack, count in sampler.stacks.most_common():
+                collapsed.write('{} {}\n'.format(stack, count))
+
+        profiler.dump_stats(path + '.prof')
+
+        stats_output = io.StringIO()
+        pstats.Stats(profiler, stream=stats_output).sort_stats('cumulative').print_stats(40)
+        sql_time = sum(duration for duration, alias, sql in query_log.queries)
+
+        with open(path + '.txt', 'w') as summary:
+            summary.write('{} {} -> {} in {:.1f} ms, {} queries in {:.1f} ms\n\n'.format(
+                request.method, request.get_full_path(), response.status_code, elapsed * 1000,
+                len(query_log.queries), sql_time * 1000))
+
+            summary.write('SQL by time\n')
+            for duration, alias, sql in sorted(query_log.queries, reverse=True):
+                summary.write('{:>10.2f} ms  [{}] {}\n'.format(duration * 1000, alias, sql))
+
+            summary.write('\nFunctions by cumulative time\n')
+            summary.write(stats_output.getvalue())
+
+        return profile_id
+
+
+class CompanyScopeMiddleware:
+    """
+    Runs every request inside company_scope() of the company picked with ?scope=<id>,
+    which is remembered in the session. ?scope= with no id goes back to the shared database.
+    Not ?company=, which views such as cost_report use as a plain filter.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if 'scope' in request.GET:
+            company_id = request.GET['scope']
+            if company_id.isdigit() and Company.objects.filter(pk=company_id).exists():
+                request.session[COMPANY_SESSION_KEY] = int(company_id)
+            else:
+                request.session.pop(COMPANY_SESSION_KEY, None)
+
+        request.company_id = request.session.get(COMPANY_SESSION_KEY)
+        request.company_choices = Company.objects.order_by('company_name')  # lazy, read by the company picker
+
+        with company_scope(request.company_id):
+            return self.get_response(request)
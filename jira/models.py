@@ -1,9 +1,11 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save
 from django.conf import settings
 from datetime import date
 
+from .tenancy import CompanyScopedManager
+
 
 class MyUser(AbstractUser):  # add AUTH_USER_MODEL = 'jira.MyUser' in settings.py
 
@@ -16,8 +18,10 @@ class MyUser(AbstractUser):  # add AUTH_USER_MODEL = 'jira.MyUser' in settings.p
     # username will not unique for people having different domain name but same local-part of email id
     username = models.CharField(max_length=100, null=True, blank=True)
     email = models.EmailField(blank=False, unique=True, max_length=200)
-    designation = models.CharField(blank=False, choices=DESIGNATION_CHOICES, max_length=200, default=None)
-    full_name = models.CharField(blank=False, unique=False, max_length=100, default=None)
+    designation = models.CharField(blank=False, choices=DESIGNATION_CHOICES, max_length=200, default=None,
+                                   db_index=True)
+    full_name = models.CharField(blank=False, unique=False, max_length=100, default=None,
+                                 db_index=True)  # admin search
 
     REQUIRED_FIELDS = ['designation', 'full_name', 'username']
     USERNAME_FIELD = 'email'  # making user login using email, not username
@@ -60,6 +64,12 @@ class Employee(models.Model):
         permissions = (
             ('view_employees', 'Can View Employees'),
         )
+        indexes = [  # filters and sort keys of the employee list
+            models.Index(fields=['gender']),
+            models.Index(fields=['age']),
+            models.Index(fields=['salary']),
+            models.Index(fields=['date_of_joining']),
+        ]
 
 
 def create_profile(sender, **kwargs):
@@ -93,10 +103,13 @@ class Project(models.Model):
 
     company = models.ForeignKey('Company', on_delete=models.CASCADE)
     project_code = models.CharField(max_length=50, unique=True, default=None)
-    project_name = models.CharField(max_length=200, unique=False, default=None)
+    project_name = models.CharField(max_length=200, unique=False, default=None, db_index=True)  # admin search
     team_members = models.ManyToManyField(MyUser, related_name='team_employees')
     team_leader = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='team_leader')
 
+    objects = models.Manager()
+    scoped = CompanyScopedManager('company')  # partitioned by company, see tenancy.py
+
     def __str__(self):
         return '{} project of company {}'.format(self.project_name, self.company)
 
@@ -108,7 +121,7 @@ class Project(models.Model):
 
 class Module(models.Model):
 
-    module_name = models.CharField(max_length=200)
+    module_name = models.CharField(max_length=200, db_index=True)  # admin search
     module_code = models.CharField(max_length=100, unique=True)
     project = models.ForeignKey(Project, on_delete=models.CASCADE)
     employee = models.OneToOneField(MyUser, related_name='employer_model', on_delete=models.CASCADE)
@@ -116,6 +129,9 @@ class Module(models.Model):
     end_date = models.DateTimeField()
     assignee = models.ForeignKey(MyUser, related_name='assignee', on_delete=models.CASCADE)
 
+    objects = models.Manager()
+    scoped = CompanyScopedManager('project__company')
+
     def __str__(self):
         return '{} module of {} for employee {} '.format(self.module_name, self.project, self.employee)
 
@@ -124,3 +140,96 @@ class Module(models.Model):
             ('view_modules', 'Can View Modules'),
             ('emp_view_module', 'Modules only Emp can view'),
         )
+        indexes = [
+            models.Index(fields=['end_date']),  # archive_modules picks finished modules by end_date
+        ]
+
+
+def remember_previous_assignment(sender, instance, using, **kwargs):
+    """
+    Keeps the stored project, employee and assignee of a module that is about to be updated
+    on the instance, for the signal handlers in reports.py and changes.py
+    """
+    instance._previous_assignment = None
+    if instance.pk is not None:
+        instance._previous_assignment = (Module.objects.using(using).filter(pk=instance.pk)
+                                         .values('project_id', 'employee_id', 'assignee_id').first())
+
+
+pre_save.connect(remember_previous_assignment, sender=Module)
+
+
+class ArchivedModule(models.Model):
+    """
+    Module whose end_date passed long ago, moved out of the Module table by archive.py.
+    Users are kept nullable so the history outlives deleted accounts, the original id is kept for restores.
+    """
+    original_id = models.PositiveIntegerField(db_index=True)  # not unique, a reset Module sequence may hand it out again
+    module_name = models.CharField(max_length=200, db_index=True)
+    module_code = models.CharField(max_length=100, db_index=True)  # not unique, live modules may reuse a code
+    project = models.ForeignKey(Project, related_name='archived_modules', on_delete=models.CASCADE)
+    employee = models.ForeignKey(MyUser, related_name='archived_modules', null=True, on_delete=models.SET_NULL)
+    start_date = models.DateTimeField()
+    end_date = models.DateTimeField(db_index=True)
+    assignee = models.ForeignKey(MyUser, related_name='archived_assignee', null=True, on_delete=models.SET_NULL)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = models.Manager()
+    scoped = CompanyScopedManager('project__company')
+
+    def __str__(self):
+        return '{} archived module of {}'.format(self.module_name, self.project)
+
+
+class ProjectCostSummary(models.Model):
+    """
+    Materialized labour cost of a project, kept up to date by the signal handlers in reports.py.
+    labour_cost is the sum over the project's live and archived modules of the employee's yearly salary
+    times the module duration in years.
+    """
+    project = models.OneToOneField(Project, related_name='cost_summary', on_delete=models.CASCADE)
+    company = models.ForeignKey(Company, related_name='cost_summaries', on_delete=models.CASCADE)
+    module_count = models.PositiveIntegerField(default=0)
+    member_count = models.PositiveIntegerField(default=0)
+    module_days = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    labour_cost = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    objects = models.Manager()
+    scoped = CompanyScopedManager('company')
+
+    def __str__(self):
+        return 'cost of {}'.format(self.project)
+
+
+class AssignmentChange(models.Model):
+    """
+    One entry of a user's change feed, written by the signal handlers in changes.py.
+    The autoincrement id is the monotonic cursor clients send back to get only newer entries.
+    """
+    KIND_CHOICES = (
+        ('module', 'Module'),
+        ('project', 'Project'),
+    )
+    ACTION_CHOICES = (
+        ('created', 'created'),
+        ('updated', 'updated'),
+        ('deleted', 'deleted'),
+        ('added', 'added to project'),
+        ('removed', 'removed from project'),
+    )
+
+    user = models.ForeignKey(MyUser, related_name='assignment_changes', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    object_id = models.PositiveIntegerField()
+    description = models.CharField(max_length=300)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return '{} {} {} for {}'.format(self.kind, self.object_id, self.action, self.user_id)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id']),  # the feed query: user = ? and id > cursor
+        ]
@@ -0,0 +1,143 @@
+from collections import defaultdict
+from itertools import chain
+from decimal import Decimal
+
+from django.db import router, transaction
+from django.db.models import Count, Sum
+from django.db.models.signals import post_save, post_delete, m2m_changed
+
+from .models import Employee, Project, Module, ArchivedModule, ProjectCostSummary
+from .tenancy import all_databases, database_for_company
+
+REFRESH_CHUNK_SIZE = 500
+DAYS_IN_YEAR = Decimal(365)
+
+
+def refresh_project_costs(project_ids=None, chunk_size=REFRESH_CHUNK_SIZE, using=None):
+    """
+    Recomputes the ProjectCostSummary rows of the given projects, or of every project when project_ids is None.
+    Projects are handled in chunks, each chunk costs a fixed number of queries no matter how many modules it has.
+    :param using: database of the projects, default is the one the router gives
+    :return: number of summaries written
+    """
+    using = using or router.db_for_write(ProjectCostSummary)
+    if project_ids is None:
+        project_ids = Project.objects.using(using).values_list('id', flat=True).order_by('id')
+    project_ids = sorted(set(project_ids))
+
+    written = 0
+    for start in range(0, len(project_ids), chunk_size):
+        written += _refresh_chunk(project_ids[start:start + chunk_size], using)
+    return written
+
+
+def _refresh_chunk(project_ids, using):
+    projects = (Project.objects.using(using).filter(id__in=project_ids)
+                .annotate(member_count=Count('team_members'))
+                .values_list('id', 'company_id', 'member_count'))
+
+    # module count, module days and labour cost per project
+    totals = defaultdict(lambda: [0, Decimal(0), Decimal(0)])
+    modules = (Module.objects.using(using).filter(project_id__in=project_ids)
+               .values_list('project_id', 'start_date', 'end_date', 'employee__my_user__salary'))
+    archived_modules = (ArchivedModule.objects.using(using).filter(project_id__in=project_ids)
+                        .values_list('project_id', 'start_date', 'end_date', 'employee__my_user__salary'))
+
+    for project_id, start_date, end_date, salary in chain(modules.iterator(), archived_modules.iterator()):
+        days = Decimal(max((end_date - start_date).total_seconds(), 0)) / 86400
+        total = totals[project_id]
+        total[0] += 1
+        total[1] += days
+        total[2] += Decimal(salary or 0) * days / DAYS_IN_YEAR
+
+    # rows are replaced with delete and bulk insert, existing summaries keep their primary key
+    existing = dict(ProjectCostSummary.objects.using(using).filter(project_id__in=project_ids)
+                    .values_list('project_id', 'id'))
+
+    summaries = []
+    for project_id, company_id, member_count in projects:
+        module_count, module_days, labour_cost = totals[project_id]
+        summaries.append(ProjectCostSummary(id=existing.get(project_id), project_id=project_id,
+                                            company_id=company_id, module_count=module_count, member_count=member_count,
+                                            module_days=round(module_days, 2), labour_cost=round(labour_cost, 2)))
+
+    with transaction.atomic(using=using):
+        ProjectCostSummary.objects.using(using).filter(project_id__in=project_ids).delete()
+        ProjectCostSummary.objects.using(using).bulk_create(summaries)
+
+    return len(summaries)
+
+
+def project_costs(company_id=None):
+    """
+    :return: cost summaries of every project, most expensive first within each company
+    """
+    if company_id is not None:
+        return (ProjectCostSummary.objects.using(database_for_company(company_id)).filter(company_id=company_id)
+                .select_related('project', 'company').order_by('-labour_cost'))
+
+    summaries = chain.from_iterable(ProjectCostSummary.objects.using(database).select_related('project', 'company')
+                                    for database in all_databases())
+    return sorted(summaries, key=lambda summary: (summary.company.company_name, -summary.labour_cost))
+
+
+def company_costs():
+    """
+    :return: one row per company, summed over the project summaries in one aggregate query per company database
+    """
+    rows = chain.from_iterable(ProjectCostSummary.objects.using(database)
+                               .values('company_id', 'company__company_name')
+                               .annotate(project_count=Count('id'), module_count=Sum('module_count'),
+                                         member_count=Sum('member_count'), module_days=Sum('module_days'),
+                                         labour_cost=Sum('labour_cost'))
+                               for database in all_databases())
+    return sorted(rows, key=lambda row: -row['labour_cost'])
+
+
+# Signal handlers: every change that affects a cost refreshes only the projects it touches.
+# The refresh runs when the surrounding transaction commits, so cascaded deletes are finished first.
+
+def _refresh_on_commit(project_ids, using):
+    project_ids = {project_id for project_id in project_ids if project_id is not None}
+    if project_ids:
+        transaction.on_commit(lambda: refresh_project_costs(project_ids, using=using), using=using)
+
+
+def module_changed(sender, instance, using, **kwargs):
+    previous = getattr(instance, '_previous_assignment', None) or {}  # set by remember_previous_assignment
+    _refresh_on_commit({instance.project_id, previous.get('project_id')}, using)
+
+
+def project_changed(sender, instance, using, **kwargs):
+    _refresh_on_commit({instance.pk}, using)
+
+
+def salary_changed(sender, instance, created, **kwargs):
+    if created:  # a new profile has no modules yet
+        return
+    for database in all_databases():  # the employee may work for companies in any database
+        _refresh_on_commit(Module.objects.using(database).filter(employee_id=instance.employee_id)
+                           .values_list('project_id', flat=True), database)
+
+
+def membership_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            _refresh_on_commit({instance.pk}, using)
+
+    elif action == 'pre_clear':  # a user is removed from all projects, pk_set is empty for clear
+        instance._cleared_project_ids = list(Project.objects.using(using).filter(team_members=instance)
+                                             .values_list('id', flat=True))
+
+    elif action in ('post_add', 'post_remove'):
+        _refresh_on_commit(pk_set or (), using)
+
+    elif action == 'post_clear':
+        _refresh_on_commit(getattr(instance, '_cleared_project_ids', ()), using)
+
+
+post_save.connect(module_changed, sender=Module)
+post_delete.connect(module_changed, sender=Module)
+post_save.connect(project_changed, sender=Project)
+post_save.connect(salary_changed, sender=Employee)
+m2m_changed.connect(membership_changed, sender=Project.team_members.through)
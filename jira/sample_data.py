@@ -0,0 +1,70 @@
+import random
+from datetime import date, datetime, timedelta
+
+from .models import Company, Employee, Project, Module, MyUser
+
+
+def create_sample_data(companies=5, projects_per_company=4, employees=200, seed=0):
+    """
+    Fills the database with a generated dataset, used by the benchmark and advisor commands.
+    Users and their Employee rows are created with bulk_create, so the create_profile signal is not relied on.
+    :return: dict with the number of rows created per model
+    """
+    rng = random.Random(seed)
+    tag = datetime.now().strftime('%Y%m%d%H%M%S%f')
+
+    leaders_count = max(1, employees // 10)
+    users = []
+    for i in range(employees):
+        designation = 'Team Leader' if i < leaders_count else 'Employee'
+        email = 'sample{}-{}@example.com'.format(tag, i)
+        users.append(MyUser(email=email, username=email.split('@')[0], full_name='Sample User {}'.format(i),
+                            designation=designation, password='!'))
+    MyUser.objects.bulk_create(users)
+    users = list(MyUser.objects.filter(email__startswith='sample{}-'.format(tag)).order_by('id'))
+    leaders = [user for user in users if user.designation == 'Team Leader']
+    workers = [user for user in users if user.designation == 'Employee']
+
+    Employee.objects.bulk_create([
+        Employee(employee=user, age=rng.randint(18, 65), gender=rng.choice('MF'),
+                 date_of_joining=date.today() - timedelta(days=rng.randint(0, 3650)),
+                 salary=rng.randrange(20000, 200000, 1000))
+        for user in users
+    ])
+
+    Company.objects.bulk_create([
+        Company(company_name='Sample Company {} {}'.format(tag, i), year=rng.randint(1900, 2018))
+        for i in range(companies)
+    ])
+    company_objs = list(Company.objects.filter(company_name__startswith='Sample Company {} '.format(tag)))
+
+    Project.objects.bulk_create([
+        Project(company=company, project_code='P{}-{}-{}'.format(tag, company.id, i),
+                project_name='Sample Project {}'.format(i), team_leader=rng.choice(leaders))
+        for company in company_objs for i in range(projects_per_company)
+    ])
+    projects = list(Project.objects.filter(project_code__startswith='P{}-'.format(tag)))
+
+    memberships = []
+    for project in projects:
+        for member in rng.sample(workers, min(len(workers), 5)):
+            memberships.append(Project.team_members.through(project_id=project.id, myuser_id=member.id))
+    Project.team_members.through.objects.bulk_create(memberships)
+
+    # Module.employee is one-to-one, so every worker gets at most one module
+    modules = []
+    for i, worker in enumerate(workers):
+        project = rng.choice(projects)
+        start = datetime.now() - timedelta(days=rng.randint(0, 2000))
+        modules.append(Module(module_name='Sample Module {}'.format(i), module_code='M{}-{}'.format(tag, i),
+                              project=project, employee=worker, assignee=project.team_leader,
+                              start_date=start, end_date=start + timedelta(days=rng.randint(1, 180))))
+    Module.objects.bulk_create(modules)
+
+    return {
+        'users': len(users),
+        'companies': len(company_objs),
+        'projects': len(projects),
+        'memberships': len(memberships),
+        'modules': len(modules),
+    }
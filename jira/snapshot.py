@@ -0,0 +1,298 @@
+"""
+Compact binary snapshot of the jira data, written and read by the snapshot and restore_snapshot commands.
+
+File layout, all integers little-endian:
+
+    MAGIC
+    per table:  b'T' <uint32 length> <json header: model label, database alias and (column, kind) pairs>
+                b'C' <uint32 rows> then per column <uint32 length> <zlib compressed column>   (repeated)
+                b'E'
+    b'Z'
+
+A column is a null mask of one byte per row followed by the values: int64 array for ints, dates
+(ordinal) and datetimes (microseconds since the epoch), or a uint32 length array plus the utf-8 bytes for strings.
+Permissions are stored as 'app_label.codename' so a snapshot can be restored into a database
+whose permission ids differ. The shared tables are read from 'default', the partitioned ones from every database
+of all_databases(), the mirrors of the shared rows in the company databases are not stored.
+"""
+import json
+import struct
+import sys
+import zlib
+from array import array
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import signals
+from django.utils import timezone
+
+from .models import Company, Employee, Project, Module, MyUser, ArchivedModule
+from .tenancy import PARTITIONED_MODELS, all_databases
+
+MAGIC = b'JIRASNAP\x01'
+CHUNK_SIZE = 5000
+EPOCH = datetime(1970, 1, 1)
+
+INT, DATE, DATETIME, STRING, PERMISSION = 'i', 'd', 't', 's', 'p'
+INT_TYPES = ('AutoField', 'BigAutoField', 'IntegerField', 'BigIntegerField', 'SmallIntegerField',
+             'PositiveIntegerField', 'PositiveSmallIntegerField', 'BooleanField', 'NullBooleanField')
+
+
+def snapshot_models():
+    """
+    :return: models in dependency order, a restore inserts them in this order
+    """
+    return [
+        Group, Group.permissions.through,
+        Company,
+        MyUser, MyUser.groups.through, MyUser.user_permissions.through,
+        Employee,
+        Project, Project.team_members.through,
+        Module, ArchivedModule,
+    ]
+
+
+def snapshot_tables():
+    """
+    :return: (database, model) of every table in the snapshot, in the order a restore inserts them
+    """
+    models = snapshot_models()
+    tables = [(DEFAULT_DB_ALIAS, model) for model in models]
+    for database in all_databases()[1:]:
+        tables += [(database, model) for model in models if model._meta.model_name in PARTITIONED_MODELS]
+    return tables
+
+
+def dependent_models(models):
+    """
+    :return: models outside the snapshot whose foreign keys point at one of the models, directly or through
+    another dependent model (cost summaries, the change feed, the admin log), children first
+    """
+    dependents = []
+    targets = list(models)
+
+    changed = True
+    while changed:
+        changed = False
+        for model in apps.get_models(include_auto_created=True):
+            if model in targets:
+                continue
+            if any(field.is_relation and field.related_model in targets for field in model._meta.concrete_fields):
+                dependents.insert(0, model)
+                targets.append(model)
+                changed = True
+
+    return dependents
+
+
+def column_kind(field):
+    if field.is_relation:
+        if field.related_model is Permission:
+            return PERMISSION
+        field = field.target_field
+
+    internal_type = field.get_internal_type()
+    if internal_type in INT_TYPES:
+        return INT
+    if internal_type == 'DateField':
+        return DATE
+    if internal_type == 'DateTimeField':
+        return DATETIME
+    return STRING
+
+
+def _columns(model):
+    return [(field.attname, column_kind(field)) for field in model._meta.concrete_fields]
+
+
+# encoding of single columns
+
+def _little_endian(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _encode_datetime(value):
+    if timezone.is_aware(value):
+        value = timezone.make_naive(value, timezone.utc)
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _decode_datetime(value):
+    value = EPOCH + timedelta(microseconds=value)
+    if settings.USE_TZ:
+        value = timezone.make_aware(value, timezone.utc)
+    return value
+
+
+def encode_column(kind, values, permission_keys=None):
+    mask = bytes(value is None for value in values)
+
+    if kind == PERMISSION:
+        values = [None if value is None else permission_keys[value] for value in values]
+        kind = STRING
+
+    if kind == STRING:
+        encoded = [b'' if value is None else str(value).encode() for value in values]
+        payload = _little_endian(array('I', map(len, encoded))) + b''.join(encoded)
+    else:
+        if kind == DATE:
+            values = [None if value is None else value.toordinal() for value in values]
+        elif kind == DATETIME:
+            values = [None if value is None else _encode_datetime(value) for value in values]
+        payload = _little_endian(array('q', (0 if value is None else int(value) for value in values)))
+
+    return zlib.compress(mask + payload)
+
+
+def decode_column(kind, rows, data, permission_ids=None):
+    data = zlib.decompress(data)
+    mask, payload = data[:rows], data[rows:]
+
+    if kind in (STRING, PERMISSION):
+        lengths = array('I')
+        lengths.frombytes(payload[:rows * lengths.itemsize])
+        if sys.byteorder == 'big':
+            lengths.byteswap()
+        values, offset = [], rows * lengths.itemsize
+        for length in lengths:
+            values.append(payload[offset:offset + length].decode())
+            offset += length
+        if kind == PERMISSION:
+            values = [permission_ids[value] if value else None for value in values]
+    else:
+        values = array('q')
+        values.frombytes(payload)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        if kind == DATE:
+            values = [date.fromordinal(value) for value in values]
+        elif kind == DATETIME:
+            values = [_decode_datetime(value) for value in values]
+        else:
+            values = list(values)
+
+    return [None if null else value for null, value in zip(mask, values)]
+
+
+# whole file
+
+def _write_block(stream, tag, data):
+    stream.write(tag + struct.pack('<I', len(data)) + data)
+
+
+def write_snapshot(stream, chunk_size=CHUNK_SIZE):
+    """
+    Streams every table of snapshot_tables() into the binary stream, chunk_size rows at a time.
+    :return: dict of (database, model label) -> rows written
+    """
+    permission_keys = {pk: '{}.{}'.format(app_label, codename) for pk, app_label, codename in
+                       Permission.objects.values_list('id', 'content_type__app_label', 'codename')}
+    written = {}
+    stream.write(MAGIC)
+
+    for database, model in snapshot_tables():
+        columns = _columns(model)
+        header = {'model': model._meta.label, 'database': database, 'columns': columns}
+        _write_block(stream, b'T', json.dumps(header).encode())
+
+        names = [name for name, kind in columns]
+        rows = model._base_manager.using(database).order_by('pk').values_list(*names).iterator()
+        key = (database, model._meta.label)
+        written[key] = 0
+
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                _write_chunk(stream, columns, chunk, permission_keys)
+                written[key] += len(chunk)
+                chunk = []
+        if chunk:
+            _write_chunk(stream, columns, chunk, permission_keys)
+            written[key] += len(chunk)
+
+        stream.write(b'E')
+
+    stream.write(b'Z')
+    return written
+
+
+def _write_chunk(stream, columns, chunk, permission_keys):
+    stream.write(b'C' + struct.pack('<I', len(chunk)))
+    for index, (name, kind) in enumerate(columns):
+        data = encode_column(kind, [row[index] for row in chunk], permission_keys)
+        stream.write(struct.pack('<I', len(data)) + data)
+
+
+def _read(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("Snapshot file is truncated")
+    return data
+
+
+def read_snapshot(stream):
+    """
+    Reads a snapshot file chunk by chunk.
+    :return: generator of (database, model label, column names, rows) with at most one chunk of rows at a time,
+    files written before the company databases existed hold 'default' only
+    """
+    if _read(stream, len(MAGIC)) != MAGIC:
+        raise ValueError("Not a jira snapshot file")
+
+    permission_ids = {'{}.{}'.format(app_label, codename): pk for pk, app_label, codename in
+                      Permission.objects.values_list('id', 'content_type__app_label', 'codename')}
+
+    while True:
+        tag = _read(stream, 1)
+        if tag == b'Z':
+            return
+        if tag != b'T':
+            raise ValueError("Corrupt snapshot file, expected a table header")
+
+        size, = struct.unpack('<I', _read(stream, 4))
+        header = json.loads(_read(stream, size).decode())
+        names = [name for name, kind in header['columns']]
+
+        while True:
+            tag = _read(stream, 1)
+            if tag == b'E':
+                break
+            if tag != b'C':
+                raise ValueError("Corrupt snapshot file, expected a chunk")
+
+            rows, = struct.unpack('<I', _read(stream, 4))
+            columns = []
+            for name, kind in header['columns']:
+                size, = struct.unpack('<I', _read(stream, 4))
+                columns.append(decode_column(kind, rows, _read(stream, size), permission_ids))
+
+            yield header.get('database', DEFAULT_DB_ALIAS), header['model'], names, list(zip(*columns))
+
+
+@contextmanager
+def signals_disabled():
+    """
+    Disconnects every model signal receiver for the duration of the block,
+    so a restore does not run create_profile or the cost summary refresh per row.
+    """
+    model_signals = [signals.pre_save, signals.post_save, signals.pre_delete, signals.post_delete,
+                     signals.m2m_changed]
+    saved = []
+    for signal in model_signals:
+        saved.append(signal.receivers)
+        signal.receivers = []
+        signal.sender_receivers_cache.clear()
+    try:
+        yield
+    finally:
+        for signal, receivers in zip(model_signals, saved):
+            signal.receivers = receivers
+            signal.sender_receivers_cache.clear()
@@ -0,0 +1,77 @@
+// listens to the logged user's assignment changes and offers a reload, instead of reloading the list to look for them.
+// The feed is polled, the server answers 'stream' when it runs workers that can hold an event stream open.
+// Polls back off while nothing changes, and a hidden tab neither polls nor streams until it is shown again.
+(function () {
+    var feed = document.getElementById('changeFeed');
+    if (!feed || !window.XMLHttpRequest) {
+        return;
+    }
+
+    var url = feed.getAttribute('data-url');
+    var count = 0;
+    var cursor = null;
+    var delay = null;
+    var source = null;
+    var paused = false;
+
+    function show(change) {
+        count += 1;
+
+        feed.textContent = count + ' new change(s), latest: ' + change.kind + ' ' + change.description +
+            ' ' + change.action + '. ';
+        var reload = document.createElement('a');
+        reload.href = window.location.href;
+        reload.textContent = 'Reload';
+        feed.appendChild(reload);
+        feed.style.display = '';
+    }
+
+    function listen() {
+        source = new EventSource(url + '?cursor=' + cursor);
+        source.addEventListener('change', function (event) {
+            cursor = event.lastEventId;
+            show(JSON.parse(event.data));
+        });
+    }
+
+    function poll() {
+        if (document.hidden) {
+            paused = true;  // resumed by the visibilitychange handler
+            return;
+        }
+
+        var request = new XMLHttpRequest();
+        request.open('GET', url + '?wait=0' + (cursor === null ? '' : '&cursor=' + cursor));
+        request.onload = function () {
+            if (request.status !== 200) {
+                return;  // logged out or feed gone, stop polling
+            }
+            var data = JSON.parse(request.responseText);
+            data.changes.forEach(show);
+            cursor = data.cursor;
+
+            if (data.stream && window.EventSource) {
+                listen();
+                return;
+            }
+            // back to the short interval after a change, twice as long after each empty poll
+            delay = data.changes.length || delay === null ? data.interval : Math.min(delay * 2, data.max_interval);
+            window.setTimeout(poll, delay * 1000);
+        };
+        request.send();
+    }
+
+    document.addEventListener('visibilitychange', function () {
+        if (document.hidden && source) {
+            source.close();  // frees the worker that holds the stream
+            source = null;
+            paused = true;
+        } else if (!document.hidden && paused) {
+            paused = false;
+            delay = null;
+            poll();  // catches up on what changed while hidden
+        }
+    });
+
+    poll();
+})();
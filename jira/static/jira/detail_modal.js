@@ -0,0 +1,20 @@
+// loads the detail fragment of a row into the shared modal when its View button is clicked
+$(document).on('click', '[data-detail-url]', function () {
+    var content = $('#detailModal .modal-content');
+    content.html('<div class="modal-body">Loading...</div>');
+    $('#detailModal').modal('show');
+
+    fetch(this.getAttribute('data-detail-url'), {credentials: 'same-origin'})
+        .then(function (response) {
+            if (!response.ok) {
+                throw new Error(response.status);
+            }
+            return response.text();
+        })
+        .then(function (html) {
+            content.html(html);
+        })
+        .catch(function () {
+            content.html('<div class="modal-body">Could not load the details.</div>');
+        });
+});
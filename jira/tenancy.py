@@ -0,0 +1,224 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, models
+from django.db.models.signals import post_save, post_delete
+
+# DATABASE_ROUTERS = ['jira.tenancy.CompanyRouter'] in settings.py
+# JIRA_COMPANY_DATABASES = {7: 'acme'}   company id -> alias in DATABASES that holds the company's projects,
+#                                        memberships, modules, archived modules and cost summaries.
+#                                        Companies that are not listed stay in the 'default' database.
+
+# models that live in the database of their company, everything else is shared and lives in 'default'
+PARTITIONED_MODELS = ('project', 'project_team_members', 'module', 'archivedmodule', 'projectcostsummary')
+# shared models the partitioned tables point to, their rows are copied into every company database
+MIRRORED_MODELS = ('myuser', 'employee', 'company')
+MIRROR_CHUNK_SIZE = 500
+
+_scope = threading.local()
+
+
+def company_databases():
+    return getattr(settings, 'JIRA_COMPANY_DATABASES', {})
+
+
+def database_for_company(company_id):
+    return company_databases().get(company_id, DEFAULT_DB_ALIAS)
+
+
+def partition_databases():
+    """
+    :return: aliases of the company databases, without 'default'
+    """
+    return sorted(set(company_databases().values()) - {DEFAULT_DB_ALIAS})
+
+
+def all_databases():
+    return [DEFAULT_DB_ALIAS] + partition_databases()
+
+
+def partitioned_company_ids():
+    return [company_id for company_id, alias in company_databases().items() if alias != DEFAULT_DB_ALIAS]
+
+
+def current_company_id():
+    return getattr(_scope, 'company_id', None)
+
+
+def current_database():
+    return database_for_company(current_company_id())
+
+
+@contextmanager
+def company_scope(company_id):
+    """
+    Inside the block the scoped managers only return rows of the company and read its database,
+    and CompanyRouter sends the partitioned models there. None is the scope of the shared database.
+    """
+    previous = current_company_id()
+    _scope.company_id = company_id
+    try:
+        yield
+    finally:
+        _scope.company_id = previous
+
+
+def companies_in_scope():
+    """
+    :return: companies a new project can belong to, the current company or, outside a company scope,
+    every company of the shared database
+    """
+    from .models import Company
+
+    if current_company_id() is not None:
+        return Company.objects.filter(pk=current_company_id())
+    return Company.objects.exclude(pk__in=partitioned_company_ids())
+
+
+def taken_values(model, field, values, instance=None):
+    """
+    Unique constraints only hold within one database, this checks a unique field of a partitioned model in all of them.
+    :param instance: row being edited, its own value is not counted
+    :return: set of the values that rows of the model already use in any database
+    """
+    taken = set()
+    for database in all_databases():
+        queryset = model._base_manager.using(database).filter(**{'{}__in'.format(field): values})
+        if instance is not None and instance.pk is not None and instance._state.db == database:
+            queryset = queryset.exclude(pk=instance.pk)
+        taken.update(queryset.values_list(field, flat=True))
+    return taken
+
+
+class CompanyScopedManager(models.Manager):
+    """
+    Manager of the partitioned models, keyed on the lookup that leads to Project.company.
+    Inside company_scope() its querysets read the company's database and only return the company's rows,
+    outside they return every row of the shared database.
+    """
+    def __init__(self, company_field):
+        super(CompanyScopedManager, self).__init__()
+        self.company_field = company_field
+
+    def for_company(self, company_id):
+        return (super(CompanyScopedManager, self).get_queryset().using(database_for_company(company_id))
+                .filter(**{self.company_field: company_id}))
+
+    def get_queryset(self):
+        if current_company_id() is None:
+            return super(CompanyScopedManager, self).get_queryset().using(DEFAULT_DB_ALIAS)
+        return self.for_company(current_company_id())
+
+
+def _is_partitioned(model):
+    """
+    :param model: model class or instance, instances may be lazy objects such as request.user
+    """
+    return model._meta.app_label == 'jira' and model._meta.model_name in PARTITIONED_MODELS
+
+
+def _is_mirrored(model):
+    return model._meta.app_label == 'jira' and model._meta.model_name in MIRRORED_MODELS
+
+
+class CompanyRouter:
+    """
+    Sends the partitioned models to the database of their company: the database an instance was loaded from,
+    the one of the company a new project is given, else the one of the current company scope.
+    Shared models are written to 'default'. They are read from the database of the row they are reached from,
+    project.team_members joins the membership table of the project's database, where the users are mirrored.
+    """
+    def _database(self, model, hints, for_write):
+        instance = hints.get('instance')
+
+        if not _is_partitioned(model):
+            if instance is None or not instance._state.db or instance._state.db == DEFAULT_DB_ALIAS:
+                return None
+            if for_write:
+                return DEFAULT_DB_ALIAS  # a user loaded from its mirror is still saved to 'default'
+            if _is_mirrored(model) and (_is_partitioned(instance) or _is_mirrored(instance)):
+                return instance._state.db
+            return DEFAULT_DB_ALIAS  # e.g. the groups of a mirrored user, which are not mirrored
+
+        if instance is not None:
+            if _is_partitioned(instance) and instance._state.db:
+                return instance._state.db
+            if instance._meta.label == 'jira.Company':
+                return database_for_company(instance.pk)
+            if instance._meta.label == 'jira.Project' and instance.company_id is not None:
+                return database_for_company(instance.company_id)
+
+        if current_company_id() is not None:
+            return current_database()
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._database(model, hints, for_write=False)
+
+    def db_for_write(self, model, **hints):
+        return self._database(model, hints, for_write=True)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if _is_partitioned(obj1) and _is_partitioned(obj2):
+            return obj1._state.db == obj2._state.db
+        if _is_partitioned(obj1) or _is_partitioned(obj2):
+            return True
+        return None
+
+
+def mirror_rows(model, pks, database):
+    """
+    Inserts or updates the rows of a shared model in a company database, without sending model signals.
+    """
+    if database == DEFAULT_DB_ALIAS:
+        return
+
+    rows = list(model._base_manager.using(DEFAULT_DB_ALIAS).filter(pk__in=pks))
+    existing = set(model._base_manager.using(database).filter(pk__in=pks).values_list('pk', flat=True))
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+
+    for row in rows:
+        if row.pk in existing:
+            (model._base_manager.using(database).filter(pk=row.pk)
+             .update(**{field.attname: getattr(row, field.attname) for field in fields}))
+
+    model._base_manager.using(database).bulk_create([row for row in rows if row.pk not in existing])
+
+
+def mirror_shared_rows(database, chunk_size=MIRROR_CHUNK_SIZE):
+    """
+    Copies every company, user and employee into a company database, in chunks
+    """
+    from .models import Company, Employee, MyUser
+
+    if database == DEFAULT_DB_ALIAS:
+        return  # the shared rows live there
+
+    for model in (Company, MyUser, Employee):
+        ids = list(model._base_manager.using(DEFAULT_DB_ALIAS).order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(ids), chunk_size):
+            mirror_rows(model, ids[start:start + chunk_size], database)
+
+
+# Signal handlers keep the mirrors of the shared rows up to date. They are connected when models.py imports
+# this module, before create_profile, so a new user is mirrored before its Employee profile.
+
+def mirror_saved(sender, instance, raw, using, **kwargs):
+    if raw or using != DEFAULT_DB_ALIAS:
+        return
+    for database in partition_databases():
+        mirror_rows(sender, [instance.pk], database)
+
+
+def mirror_deleted(sender, instance, using, **kwargs):
+    if using != DEFAULT_DB_ALIAS:
+        return
+    for database in partition_databases():
+        # cascades to the partitioned rows of the company database, as the delete did in 'default'
+        sender._base_manager.using(database).filter(pk=instance.pk).delete()
+
+
+for _model in MIRRORED_MODELS:
+    post_save.connect(mirror_saved, sender='jira.{}'.format(_model))
+    post_delete.connect(mirror_deleted, sender='jira.{}'.format(_model))
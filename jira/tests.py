@@ -1,3 +1,126 @@
-from django.test import TestCase
+from unittest import skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.test import TestCase, override_settings
+
+from datetime import datetime
+
+from .forms import AddEditModuleForm, AddEditProjectForm
+from .models import Company, Employee, Module, MyUser, Project
+from .tenancy import company_scope, mirror_rows
+
+# the tenancy tests need a second alias in DATABASES to partition a company into
+PARTITION = next((alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS), None)
+
+
+@skipUnless(PARTITION, 'needs a second database in DATABASES')
+@override_settings(DATABASE_ROUTERS=['jira.tenancy.CompanyRouter'])
+class PartitionTestCase(TestCase):
+    """
+    A shared project in 'default' and a project of a partitioned company with the same id
+    """
+    multi_db = True
+
+    def setUp(self):
+        shared_company = Company.objects.create(company_name='Shared', year=2000)
+        self.users = [MyUser.objects.create(email='e{}@x.com'.format(number), username='e{}'.format(number),
+                                            full_name='E{}'.format(number), designation='Employee')
+                      for number in range(4)]
+        leader = MyUser.objects.create(email='tl@x.com', username='tl', full_name='TL', designation='Team Leader')
+
+        shared_project = Project.objects.create(company=shared_company, project_code='P1', project_name='Shared',
+                                                team_leader=leader)
+        shared_project.team_members.set(self.users[2:])
+
+        self.company = Company.objects.create(company_name='Partitioned', year=2000)
+        self.settings_override = self.settings(JIRA_COMPANY_DATABASES={self.company.pk: PARTITION})
+        self.settings_override.enable()
+
+        # mirror the shared rows the way move_company does, then reuse the id of the shared project
+        mirror_rows(Company, [self.company.pk], PARTITION)
+        mirror_rows(MyUser, [user.pk for user in self.users] + [leader.pk], PARTITION)
+        mirror_rows(Employee, list(Employee.objects.values_list('pk', flat=True)), PARTITION)
+
+        with company_scope(self.company.pk):
+            self.project = Project.objects.create(pk=shared_project.pk, company=self.company, project_code='PA',
+                                                  project_name='Partitioned', team_leader=leader)
+            self.project.team_members.set(self.users[:2])
+
+        self.shared_project, self.leader = shared_project, leader
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+
+class PartitionedProjectMembersTest(PartitionTestCase):
+    """
+    The project of the partitioned company must read its own members, not those of the shared project
+    """
+
+    def expected(self):
+        return sorted(user.pk for user in self.users[:2])
+
+    def test_team_members(self):
+        with company_scope(self.company.pk):
+            project = Project.scoped.get(pk=self.project.pk)
+            self.assertEqual(project._state.db, PARTITION)
+            self.assertEqual(sorted(user.pk for user in project.team_members.all()), self.expected())
+
+    def test_prefetch_team_members(self):
+        with company_scope(self.company.pk):
+            project = Project.scoped.prefetch_related('team_members').get(pk=self.project.pk)
+            self.assertEqual(sorted(user.pk for user in project.team_members.all()), self.expected())
+
+    def test_form_initial_members(self):
+        with company_scope(self.company.pk):
+            form = AddEditProjectForm(instance=Project.scoped.get(pk=self.project.pk))
+            self.assertEqual(sorted(user.pk for user in form.initial['team_members']), self.expected())
+
+    def test_mirrored_user_is_saved_to_default(self):
+        with company_scope(self.company.pk):
+            member = Project.scoped.get(pk=self.project.pk).team_members.order_by('pk').first()
+            member.full_name = 'Renamed'
+            member.save()
+        self.assertEqual(MyUser.objects.using(DEFAULT_DB_ALIAS).get(pk=member.pk).full_name, 'Renamed')
+        self.assertEqual(MyUser.objects.using(PARTITION).get(pk=member.pk).full_name, 'Renamed')
+
+
+class PartitionedUniquenessTest(PartitionTestCase):
+    """
+    Codes and the employee of a module are unique across every database, not only the current one
+    """
+    def setUp(self):
+        super(PartitionedUniquenessTest, self).setUp()
+        with company_scope(self.company.pk):
+            self.module = Module.objects.create(module_name='Partitioned', module_code='M1', project=self.project,
+                                                employee=self.users[0], assignee=self.leader,
+                                                start_date=datetime(2026, 1, 1), end_date=datetime(2026, 2, 1))
+
+    def module_data(self, **changes):
+        data = {'module_name': 'Shared', 'module_code': 'M2', 'project': self.shared_project.pk,
+                'employee': self.users[3].pk, 'start_date': '01-01-2026 10:00', 'end_date': '01-02-2026 10:00',
+                'assignee_by': 'x'}
+        data.update(changes)
+        return data
+
+    def test_module_form_checks_other_databases(self):
+        with company_scope(None):
+            form = AddEditModuleForm(self.module_data(module_code='M1', employee=self.users[0].pk),
+                                     logged_user=self.leader)
+            self.assertEqual(sorted(form.errors), ['employee', 'module_code'])
+            self.assertTrue(AddEditModuleForm(self.module_data(), logged_user=self.leader).is_valid())
+
+    def test_module_form_accepts_its_own_values(self):
+        with company_scope(self.company.pk):
+            form = AddEditModuleForm(self.module_data(module_code='M1', employee=self.users[0].pk,
+                                                      project=self.project.pk),
+                                     instance=Module.scoped.get(pk=self.module.pk), logged_user=self.leader)
+            self.assertTrue(form.is_valid(), form.errors)
+
+    def test_project_form_checks_other_databases(self):
+        with company_scope(None):
+            form = AddEditProjectForm({'company': self.shared_project.company_id, 'project_code': 'PA',
+                                       'project_name': 'Other', 'team_leader': self.leader.pk,
+                                       'team_members': [self.users[3].pk]})
+            self.assertEqual(list(form.errors), ['project_code'])
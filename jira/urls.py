@@ -1,10 +1,12 @@
 from django.urls import path
 from django.contrib.auth.views import logout
-from .views import (EmployeeView, EmployeeUpdateView, EmployeeDeleteView,  # EmployeeCreateView
-                    ProjectView, ProjectCreateView, ProjectUpdateView, ProjectDeleteView,
-                    ModuleView, ModuleCreateView, ModuleDeleteView, ModuleUpdateView,
-                    company_view, add_company, update_company, delete_company,
-                    register)
+from .views import (EmployeeView, EmployeeDetailView, EmployeeUpdateView, EmployeeDeleteView,  # EmployeeCreateView
+                    ProjectView, ProjectDetailView, ProjectCreateView, ProjectUpdateView, ProjectDeleteView,
+                    ModuleView, ModuleDetailView, ModuleCreateView, ModuleDeleteView, ModuleUpdateView,
+                    bulk_module_update,
+                    ArchivedModuleView, restore_archived_modules,
+                    company_view, company_detail, add_company, update_company, delete_company,
+                    cost_report, assignment_changes, register)
 
 
 urlpatterns = [
@@ -13,21 +15,31 @@ urlpatterns = [
     path('add/', view=add_company, name='add_company'),
     path('update/<int:company_id>', view=update_company, name='update'),
     path('delete/<int:company_id>', view=delete_company, name='delete'),
+    path('detail/<int:company_id>', view=company_detail, name='company_detail'),
 
     path('employee/', view=EmployeeView.as_view(), name='employee_list_view'),
+    path('employee/detail/<int:pk>/', view=EmployeeDetailView.as_view(), name='employee_detail'),
     # path('employee/add/', view=EmployeeCreateView.as_view(), name='add_employee'),
     path('employee/update/<int:pk>/', view=EmployeeUpdateView.as_view(), name='update_employee'),
     path('employee/delete/<int:pk>/', view=EmployeeDeleteView.as_view(), name='delete_employee'),
 
     path('projects/', view=ProjectView.as_view(), name='project_list_view'),
+    path('projects/detail/<int:pk>/', view=ProjectDetailView.as_view(), name='project_detail'),
     path('projects/add/', view=ProjectCreateView.as_view(), name='add_project'),
     path('projects/update/<int:pk>/', view=ProjectUpdateView.as_view(), name='update_project'),
     path('projects/delete/<int:pk>/', view=ProjectDeleteView.as_view(), name='delete_project'),
 
     path('modules/', view=ModuleView.as_view(), name='module_list_view'),
+    path('modules/detail/<int:pk>/', view=ModuleDetailView.as_view(), name='module_detail'),
     path('modules/add/', view=ModuleCreateView.as_view(), name='add_module'),
     path('modules/update/<int:pk>/', view=ModuleUpdateView.as_view(), name='update_module'),
     path('modules/delete/<int:pk>/', view=ModuleDeleteView.as_view(), name='delete_module'),
+    path('modules/bulk/', view=bulk_module_update, name='bulk_module_update'),
+    path('modules/archive/', view=ArchivedModuleView.as_view(), name='archived_module_list_view'),
+    path('modules/archive/restore/', view=restore_archived_modules, name='restore_archived_modules'),
+
+    path('reports/costs/', view=cost_report, name='cost_report'),
+    path('changes/', view=assignment_changes, name='assignment_changes'),
 
     path('register/', view=register, name='register'),
     path('logout/', logout, {'template_name': 'logout.html'}, name='logout'),  # 'login' path in main urls.py
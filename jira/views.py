@@ -1,8 +1,15 @@
+import json
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404, HttpResponseRedirect
 from django.urls import reverse_lazy
 from django.contrib import messages
 from django.core.exceptions import ImproperlyConfigured, PermissionDenied
 from django.views import generic
+from django.views.decorators.http import require_POST
+from django.db.models import Count, Q
 
 # for login restrictions
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
@@ -10,9 +17,14 @@ from django.contrib.auth.decorators import login_required, permission_required
 # LOGIN_URL = 'login' in settings.py
 # LOGIN_REDIRECT_URL = 'company_list_view'
 
-from .models import Company, Employee, Project, Module, MyUser
+from .models import Company, Employee, Project, Module, MyUser, ArchivedModule
+from .reports import project_costs, company_costs
+from .archive import restore_modules
+from .bulk import bulk_change_modules
+from .changes import (latest_cursor, changes_after, wait_for_changes, CLIENT_INTERVAL, CLIENT_MAX_INTERVAL,
+                      POLL_INTERVAL, STREAMING, MAX_WAIT)
 from .forms import (AddEditCompanyForm, EditEmployeeForm, AddEditProjectForm, AddEditModuleForm,
-                    UserRegistrationForm)
+                    UserRegistrationForm, EmployeeFilterForm, BulkModuleForm)
 
 
 # LOGIN_URL = 'login'
@@ -122,9 +134,90 @@ def delete_company(request, company_id):
     return redirect('company_list_view')
 
 
+@login_required
+def company_detail(request, company_id):
+    """
+    :param company_id: id of the company whose details are shown
+    :return: modal content with the company's details, fetched by the list page when View is clicked
+    """
+    if not request.user.groups.filter(name='Admin Group').exists():
+        raise PermissionDenied
+
+    return render(request, 'company_detail.html', {'company': get_object_or_404(Company, id=company_id)})
+
+
+@login_required
+def cost_report(request):
+    """
+    :param request: GET request, optional 'company' parameter limits the project rows to one company
+    :return: labour cost per company and per project from the materialized cost summaries, Admin Group only
+    """
+    if not request.user.groups.filter(name='Admin Group').exists():
+        raise PermissionDenied
+
+    company_id = request.GET.get('company')
+    company_id = int(company_id) if company_id and company_id.isdigit() else None
+
+    return render(request, 'cost_report.html', {'companies': company_costs(),
+                                                'projects': project_costs(company_id)})
+
+
+@login_required
+def assignment_changes(request):
+    """
+    Change feed of the logged user's module and project assignments.
+    :param request: GET with 'cursor', the Last-Event-ID header of a reconnecting EventSource comes first.
+    Without a cursor the feed starts at the newest entry.
+    :return: JSON with the changes after the cursor, the poll intervals and whether the client may stream.
+    With CHANGE_FEED_STREAMING on, a server-sent event stream when the client accepts text/event-stream, and
+    the JSON waits up to 'wait' seconds (long-poll) for the first change.
+    """
+    cursor = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('cursor', '')
+    cursor = int(cursor) if cursor.isdigit() else latest_cursor(request.user)
+    streaming = getattr(settings, 'CHANGE_FEED_STREAMING', STREAMING)
+    max_wait = getattr(settings, 'CHANGE_FEED_MAX_WAIT', MAX_WAIT) if streaming else 0
+
+    if 'text/event-stream' in request.META.get('HTTP_ACCEPT', ''):
+        if not streaming:
+            return HttpResponse(status=204)  # tells an EventSource not to reconnect
+        response = StreamingHttpResponse(change_events(request.user, cursor, max_wait),
+                                         content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # stops nginx from buffering the stream
+        return response
+
+    wait = request.GET.get('wait', '0')
+    wait = min(int(wait), max_wait) if wait.isdigit() else 0
+    changes = wait_for_changes(request.user, cursor, wait)
+
+    return JsonResponse({'cursor': changes[-1]['id'] if changes else cursor, 'changes': changes,
+                         'interval': getattr(settings, 'CHANGE_FEED_CLIENT_INTERVAL', CLIENT_INTERVAL),
+                         'max_interval': getattr(settings, 'CHANGE_FEED_CLIENT_MAX_INTERVAL', CLIENT_MAX_INTERVAL),
+                         'stream': streaming})
+
+
+def change_events(user, cursor, max_wait):
+    """
+    Server-sent events for assignment_changes. The stream closes after max_wait seconds and the
+    browser reconnects with Last-Event-ID, so no worker is held forever, but one is held per open page.
+    """
+    interval = getattr(settings, 'CHANGE_FEED_POLL_INTERVAL', POLL_INTERVAL)
+    deadline = time.monotonic() + max_wait
+
+    yield 'retry: {}\nid: {}\nevent: cursor\ndata: {}\n\n'.format(interval * 1000, cursor, cursor)
+
+    while time.monotonic() < deadline:
+        changes = changes_after(user, cursor)
+        for change in changes:
+            cursor = change['id']
+            yield 'id: {}\nevent: change\ndata: {}\n\n'.format(cursor, json.dumps(change))
+        if not changes:
+            time.sleep(interval)
+
+
 class EmployeeView(LoginRequiredMixin, PermissionRequiredMixin, generic.ListView):
     """
-        Generic View to View all Employees
+        Generic View to View all Employees, filtered and sorted with the GET parameters of EmployeeFilterForm
     """
     permission_required = 'jira.view_employees'
     raise_exception = True
@@ -132,6 +225,74 @@ class EmployeeView(LoginRequiredMixin, PermissionRequiredMixin, generic.ListView
     context_object_name = 'employees'
     model = Employee
 
+    def get_queryset(self):
+
+        self.filter_form = EmployeeFilterForm(self.request.GET)
+        queryset = Employee.objects.select_related('employee')
+
+        for query in self.filter_form.get_filters().values():
+            queryset = queryset.filter(query)
+
+        return queryset.order_by(*self.filter_form.get_ordering())
+
+    def get_context_data(self, **kwargs):
+
+        context = super(EmployeeView, self).get_context_data(**kwargs)
+        context['filter_form'] = self.filter_form
+        context['facets'] = self.get_facets()
+        return context
+
+    def get_facets(self):
+        """
+        Counts of every facet value come from one aggregate query. Each count applies all the
+        selected filters except the one of its own facet, so the other values of a facet stay visible.
+        :return: list of facets with their values, counts and the link that toggles each value
+        """
+        form = self.filter_form
+        filters = form.get_filters()
+        aggregates = {}
+
+        for facet in form.FACETS:
+            others = Q()
+            for name, query in filters.items():
+                if name != facet:
+                    others &= query
+
+            for index, (value, label) in enumerate(form.facet_choices(facet)):
+                aggregates['{}_{}'.format(facet, index)] = Count('id', filter=others & form.facet_q(facet, value))
+
+        counts = Employee.objects.aggregate(**aggregates)
+
+        facets = []
+        for facet in form.FACETS:
+            selected = form.cleaned_data.get(facet) if form.is_valid() else None
+            values = []
+
+            for index, (value, label) in enumerate(form.facet_choices(facet)):
+                params = self.request.GET.copy()
+                if value == selected:
+                    params.pop(facet, None)
+                else:
+                    params[facet] = value
+
+                values.append({'value': value, 'label': label, 'count': counts['{}_{}'.format(facet, index)],
+                               'selected': value == selected, 'url': '?' + params.urlencode()})
+
+            facets.append({'name': facet, 'label': form[facet].label, 'values': values})
+
+        return facets
+
+
+class EmployeeDetailView(LoginRequiredMixin, PermissionRequiredMixin, generic.DetailView):
+    """
+        Generic View to return the detail modal content of one Employee
+    """
+    permission_required = 'jira.view_employees'
+    raise_exception = True
+    template_name = 'employee_detail.html'
+    context_object_name = 'emp'
+    queryset = Employee.objects.select_related('employee')
+
 
 """
 EmployeeCreateView removed as Employee will be created with register page
@@ -169,10 +330,10 @@ class EmployeeUpdateView(LoginRequiredMixin, PermissionRequiredMixin, generic.Up
         user_model_obj = Employee.objects.get(id=self.kwargs['pk']).employee
 
         if user_model_obj.designation == 'Employee':
-            context['projects'] = user_model_obj.team_employees.all()
+            context['projects'] = Project.scoped.filter(team_members=user_model_obj)
 
         if user_model_obj.designation == 'Team Leader':
-            context['projects'] = user_model_obj.team_leader.all()
+            context['projects'] = Project.scoped.filter(team_leader=user_model_obj)
 
         if user_model_obj.designation == 'Admin':
             context['admin'] = """The Employee you have selected belongs to Admin Group. 
@@ -233,17 +394,43 @@ class ProjectView(LoginRequiredMixin, PermissionRequiredMixin, generic.ListView)
     def get_queryset(self):
 
         if self.request.user.groups.filter(name='Admin Group').exists():
-            return Project.objects.all()
+            return Project.scoped.all()
 
         elif self.request.user.groups.filter(name='Team Leader Group').exists():
-            return self.request.user.team_leader.all()
+            return Project.scoped.filter(team_leader=self.request.user)
 
         elif self.request.user.groups.filter(name='Low Level Employee Group').exists():
-            return self.request.user.team_employees.all()
+            return Project.scoped.filter(team_members=self.request.user)
 
         raise PermissionDenied
 
 
+class ProjectDetailView(LoginRequiredMixin, PermissionRequiredMixin, generic.DetailView):
+    """
+        Generic View to return the detail modal content of one project
+    """
+    permission_required = 'jira.view_projects'
+    raise_exception = True
+    template_name = 'project_detail.html'
+    context_object_name = 'proj'
+
+    def get_queryset(self):
+
+        if self.request.user.groups.filter(name='Admin Group').exists():
+            queryset = Project.scoped.all()
+
+        elif self.request.user.groups.filter(name='Team Leader Group').exists():
+            queryset = Project.scoped.filter(team_leader=self.request.user)
+
+        elif self.request.user.groups.filter(name='Low Level Employee Group').exists():
+            queryset = Project.scoped.filter(team_members=self.request.user)
+
+        else:
+            raise PermissionDenied
+
+        return queryset.select_related('company', 'team_leader').prefetch_related('team_members')
+
+
 class ProjectCreateView(LoginRequiredMixin, PermissionRequiredMixin, generic.CreateView):
     """
         Generic View to Create an project
@@ -273,10 +460,13 @@ class ProjectUpdateView(LoginRequiredMixin, PermissionRequiredMixin, generic.Upd
     model = Project
     success_url = reverse_lazy('project_list_view')
 
+    def get_queryset(self):
+        return Project.scoped.all()
+
     def get_context_data(self, **kwargs):
 
         context = super(ProjectUpdateView, self).get_context_data(**kwargs)
-        context["modules"] = Module.objects.filter(project=self.kwargs['pk'])
+        context["modules"] = Module.scoped.filter(project=self.kwargs['pk'])
         return context
 
     def get(self, request, *args, **kwargs):
@@ -284,7 +474,7 @@ class ProjectUpdateView(LoginRequiredMixin, PermissionRequiredMixin, generic.Upd
         if self.request.user.groups.filter(name='Team Leader Group').exists():
             self.object = self.get_object()
 
-            if self.object in self.request.user.team_leader.all():
+            if self.object in Project.scoped.filter(team_leader=self.request.user):
                 return super().get(request, *args, **kwargs)
 
             raise PermissionDenied
@@ -312,6 +502,9 @@ class ProjectDeleteView(LoginRequiredMixin, PermissionRequiredMixin, generic.Del
     model = Project
     success_url = reverse_lazy('project_list_view')
 
+    def get_queryset(self):
+        return Project.scoped.all()
+
     def get_success_url(self):
         if self.success_url:
             messages.warning(
@@ -335,17 +528,44 @@ class ModuleView(LoginRequiredMixin, PermissionRequiredMixin, generic.ListView):
     def get_queryset(self):
 
         if self.request.user.groups.filter(name='Admin Group').exists():
-            return Module.objects.all()
+            return Module.scoped.all()
 
         elif self.request.user.groups.filter(name='Team Leader Group').exists():
-            return self.request.user.assignee.all()
+            return Module.scoped.filter(assignee=self.request.user)
 
         elif self.request.user.groups.filter(name='Low Level Employee Group').exists():
-            return self.request.user.employer_model
+            # the employee's one module, None when it is in another company than the picked one
+            return Module.scoped.filter(employee=self.request.user).first()
 
         raise PermissionDenied
 
 
+class ModuleDetailView(LoginRequiredMixin, PermissionRequiredMixin, generic.DetailView):
+    """
+        Generic View to return the detail modal content of one Module
+    """
+    permission_required = 'jira.view_modules'
+    raise_exception = True
+    template_name = 'module_detail.html'
+    context_object_name = 'mod'
+
+    def get_queryset(self):
+
+        if self.request.user.groups.filter(name='Admin Group').exists():
+            queryset = Module.scoped.all()
+
+        elif self.request.user.groups.filter(name='Team Leader Group').exists():
+            queryset = Module.scoped.filter(assignee=self.request.user)
+
+        elif self.request.user.groups.filter(name='Low Level Employee Group').exists():
+            queryset = Module.scoped.filter(employee=self.request.user)
+
+        else:
+            raise PermissionDenied
+
+        return queryset.select_related('project__company', 'employee', 'assignee')
+
+
 class ModuleCreateView(LoginRequiredMixin, PermissionRequiredMixin, generic.CreateView):
     """
         Generic View to Create an module
@@ -387,13 +607,16 @@ class ModuleUpdateView(LoginRequiredMixin, PermissionRequiredMixin, generic.Upda
     model = Module
     success_url = reverse_lazy('module_list_view')
 
+    def get_queryset(self):
+        return Module.scoped.all()
+
     def get(self, request, *args, **kwargs):
 
         if self.request.user.groups.filter(name='Team Leader Group').exists():
 
             self.object = self.get_object()
 
-            if self.object in self.request.user.assignee.all():
+            if self.object in Module.scoped.filter(assignee=self.request.user):
                 return super().get(request, *args, **kwargs)
 
             raise PermissionDenied
@@ -427,6 +650,9 @@ class ModuleDeleteView(LoginRequiredMixin, PermissionRequiredMixin, generic.Dele
     model = Module
     success_url = reverse_lazy('module_list_view')
 
+    def get_queryset(self):
+        return Module.scoped.all()
+
     def get_success_url(self):
         if self.success_url:
             messages.warning(
@@ -435,3 +661,101 @@ class ModuleDeleteView(LoginRequiredMixin, PermissionRequiredMixin, generic.Dele
         else:
             raise ImproperlyConfigured(
                 "No URL to redirect to. Provide a success_url.")
+
+
+
+@login_required
+@permission_required('jira.change_module', raise_exception=True)
+def bulk_module_update(request):
+    """
+    :param request: GET lists the modules the logged user may change with the bulk change form,
+    POST applies the form to the selected modules in one transaction
+    :return: the same page, after a POST with the result of every selected module
+    """
+    if request.user.groups.filter(name='Admin Group').exists():
+        modules = Module.scoped.all()
+
+    elif request.user.groups.filter(name='Team Leader Group').exists():
+        modules = Module.scoped.filter(assignee=request.user)
+
+    else:
+        raise PermissionDenied
+
+    results = None
+    if request.method == 'POST':
+        form = BulkModuleForm(request.POST, modules=modules)
+
+        if form.is_valid():
+            results = sorted(bulk_change_modules(form.cleaned_data['modules'], **form.get_changes()).values())
+            changed = sum(1 for module_code, reason in results if reason is None)
+            messages.success(request, '{} of {} modules changed'.format(changed, len(results)))
+            form = BulkModuleForm(modules=modules)
+
+    else:
+        form = BulkModuleForm(modules=modules)
+
+    return render(request, 'bulk_module_form.html', {
+        'form': form,
+        'results': results,
+        'modules': modules.select_related('project', 'employee', 'assignee').order_by('id'),
+        'employees': MyUser.objects.filter(designation='Employee').order_by('email').values_list('email', 'full_name'),
+    })
+
+
+class ArchivedModuleView(LoginRequiredMixin, PermissionRequiredMixin, generic.ListView):
+    """
+        Generic View to search the archived modules, the read path for finished work that left the Module table
+    """
+    permission_required = 'jira.view_modules'
+    raise_exception = True
+    template_name = 'archived_module_list_view.html'
+    context_object_name = 'modules'
+    model = ArchivedModule
+    paginate_by = 50
+
+    def get_queryset(self):
+
+        if self.request.user.groups.filter(name='Admin Group').exists():
+            queryset = ArchivedModule.scoped.all()
+
+        elif self.request.user.groups.filter(name='Team Leader Group').exists():
+            queryset = ArchivedModule.scoped.filter(assignee=self.request.user)
+
+        elif self.request.user.groups.filter(name='Low Level Employee Group').exists():
+            queryset = ArchivedModule.scoped.filter(employee=self.request.user)
+
+        else:
+            raise PermissionDenied
+
+        search = self.request.GET.get('q', '').strip()
+        if search:
+            queryset = queryset.filter(Q(module_code=search) | Q(module_name__istartswith=search))
+
+        return queryset.select_related('project__company', 'employee', 'assignee').order_by('-end_date')
+
+    def get_context_data(self, **kwargs):
+
+        context = super(ArchivedModuleView, self).get_context_data(**kwargs)
+        context['search'] = self.request.GET.get('q', '')
+        return context
+
+
+@login_required
+@require_POST
+def restore_archived_modules(request):
+    """
+    :param request: POST with the ids of the archived modules to restore
+    :return: moves them back into the Module table and redirects to the archive, Admin Group only
+    """
+    if not request.user.groups.filter(name='Admin Group').exists():
+        raise PermissionDenied
+
+    ids = [int(value) for value in request.POST.getlist('archived') if value.isdigit()]
+    ids = list(ArchivedModule.scoped.filter(id__in=ids).values_list('id', flat=True))  # only the current company's
+    restored, skipped = restore_modules(ids)
+
+    messages.success(request, '{} modules restored'.format(restored))
+    for module_code, reason in skipped:
+        messages.warning(request, '{} not restored: {}'.format(module_code, reason))
+
+    return redirect('archived_module_list_view')